@@ -0,0 +1,40 @@
+#
+#       (C) 2013 Varun Mittal <varunmittal91@gmail.com>
+#       JARVIS program is distributed under the terms of the GNU General Public License v3
+#
+#       This file is part of JARVIS.
+#
+#       JARVIS is free software: you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation version 3 of the License.
+#
+#       JARVIS is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with JARVIS.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# benchmarks run offline, outside of a django project
+from django.conf import settings
+if not settings.configured:
+    settings.configure(ES_HOSTS=[{'host': '127.0.0.1', 'port': 19200}], CS_HOSTS=[])
+
+import time
+
+def timed(func, repeat=5, number=1):
+    best = None
+    for i in xrange(repeat):
+        start = time.time()
+        for j in xrange(number):
+            func()
+        elapsed = (time.time() - start) / number
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
@@ -0,0 +1,71 @@
+#
+#       (C) 2013 Varun Mittal <varunmittal91@gmail.com>
+#       JARVIS program is distributed under the terms of the GNU General Public License v3
+#
+#       This file is part of JARVIS.
+#
+#       JARVIS is free software: you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation version 3 of the License.
+#
+#       JARVIS is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with JARVIS.  If not, see <http://www.gnu.org/licenses/>.
+#
+# usage: python -m benchmarks.bench_bulk
+# EsActions batching: serialization cost per action, and indexing throughput into a local
+# stand-in node with one and with several bulk requests in flight.
+
+import time
+
+from . import timed
+from .fake_cluster import FakeCluster
+from .bench_tokenize import make_titles
+import jarvis_search.index as index_module
+from jarvis_search.conn import ElasticSearchClient
+from jarvis_search.index import EsIndex, EsActions
+from jarvis_search.scored_document import EsSearchDocument, EsTextField
+
+def put_action(document, index_name):
+    doc = document.getDoc(index_name)
+    return {'_index': doc['index'], '_type': doc['doc_type'], '_id': doc['id'], '_source': doc['body']}
+
+def run(count=5000, port=19206, concurrency=(1, 4)):
+    documents = [EsSearchDocument(doc_type='product', rank=i, id=str(i), fields=[EsTextField(name='title', value=title)])
+                 for i, title in enumerate(make_titles(count))]
+    cluster = FakeCluster(port=port).start()
+    client = index_module.es_client_conn
+    try:
+        index_module.es_client_conn = ElasticSearchClient(servers=[{'host': '127.0.0.1', 'port': port}])
+        index = EsIndex('benchmark_bulk')
+        actions = [put_action(document, index.getName()) for document in documents]
+        def batch():
+            bulk = EsActions(max_actions=count + 1)
+            for action in actions:
+                bulk.addAction(action)
+        results = {'documents': count}
+        results['serialize_action'] = timed(batch, repeat=3) / count
+        for size in concurrency:
+            index = EsIndex('benchmark_bulk', concurrency=size)
+            requests = cluster.requests
+            start = time.time()
+            index.put(documents)
+            elapsed = time.time() - start
+            results['concurrency_%d_docs_per_second' % size] = count / elapsed
+            results['concurrency_%d_requests' % size] = cluster.requests - requests
+        return results
+    finally:
+        index_module.es_client_conn = client
+        cluster.stop()
+
+if __name__ == '__main__':
+    results = run()
+    print "serialize: %.2fus/action" % (results['serialize_action'] * 1e6)
+    for key in sorted(results):
+        if key.endswith('_docs_per_second'):
+            name = key[:-len('_docs_per_second')]
+            print "%-13s %8.0f docs/s over %d requests" % (name, results[key], results['%s_requests' % name])
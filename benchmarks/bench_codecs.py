@@ -0,0 +1,78 @@
+#
+#       (C) 2013 Varun Mittal <varunmittal91@gmail.com>
+#       JARVIS program is distributed under the terms of the GNU General Public License v3
+#
+#       This file is part of JARVIS.
+#
+#       JARVIS is free software: you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation version 3 of the License.
+#
+#       JARVIS is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with JARVIS.  If not, see <http://www.gnu.org/licenses/>.
+#
+# usage: python -m benchmarks.bench_codecs
+# stored bytes and cpu per blob codec on typical payloads, against the hex encoded textAsBlob
+# literals blobs were sent as before.
+
+import json
+import zlib
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from . import timed
+from .fake_cassandra import install
+from .bench_tokenize import make_titles
+install()
+from jarvis_search.nhpcdb import blob
+from jarvis_search.nhpcdb.model import BlobProperty
+
+codecs = [('none', None), ('zlib', 1), ('zlib', 6), ('zlib', 9), ('bz2', 9), ('lzma', 6)]
+
+def make_payloads(count=500):
+    titles = make_titles(count * 20)
+    return {
+        'title': titles[:count],
+        'json': [json.dumps({'title': title, 'tags': title.split(), 'rank': i}) for i, title in enumerate(titles[:count])],
+        'pickle': [pickle.dumps({'title': title, 'tags': title.split(), 'rank': i}, pickle.HIGHEST_PROTOCOL) for i, title in enumerate(titles[:count])],
+        'document': [json.dumps({'titles': titles[i:i+20]}) for i in xrange(0, count * 20, 20)],
+    }
+
+def run(count=500):
+    payloads = make_payloads(count)
+    results = {}
+    for kind, values in payloads.items():
+        results[kind] = {
+            'raw_bytes': sum([len(value) for value in values]) / len(values),
+            # textAsBlob('<hex of zlib>') as written with compressed=True before
+            'legacy_bytes': sum([len("textAsBlob('%s')" % zlib.compress(value).encode('hex')) for value in values]) / len(values),
+        }
+        for name, level in codecs:
+            if name not in blob.codec_names:
+                continue
+            prop = BlobProperty(codec=name, level=level, min_size=0)
+            stored = [prop.setValue(value) for value in values]
+            assert [prop.readValue(value) for value in stored] == values
+            label = name if level is None else "%s_%d" % (name, level)
+            results[kind][label] = {
+                'bytes': sum([len(value) for value in stored]) / len(values),
+                'encode': timed(lambda: [prop.setValue(value) for value in values], repeat=3) / len(values),
+                'decode': timed(lambda: [prop.readValue(value) for value in stored], repeat=3) / len(values),
+            }
+    return results
+
+if __name__ == '__main__':
+    results = run()
+    for kind in sorted(results):
+        print "%s: %d bytes raw, %d as a legacy literal" % (kind, results[kind]['raw_bytes'], results[kind]['legacy_bytes'])
+        for label in sorted(results[kind]):
+            if isinstance(results[kind][label], dict):
+                stats = results[kind][label]
+                print "  %-8s %6d bytes  encode %7.2fus  decode %7.2fus" % (label, stats['bytes'], stats['encode'] * 1e6, stats['decode'] * 1e6)
@@ -0,0 +1,69 @@
+#
+#       (C) 2013 Varun Mittal <varunmittal91@gmail.com>
+#       JARVIS program is distributed under the terms of the GNU General Public License v3
+#
+#       This file is part of JARVIS.
+#
+#       JARVIS is free software: you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation version 3 of the License.
+#
+#       JARVIS is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with JARVIS.  If not, see <http://www.gnu.org/licenses/>.
+#
+# usage: python -m benchmarks.bench_hedging
+# query latency against two local stand-in nodes with injected slowness, with and without hedging,
+# and the share of reads sent to a node that is consistently slow.
+
+import time
+
+from . import percentile
+from .fake_cluster import FakeCluster
+import jarvis_search.index as index_module
+from jarvis_search.conn import ElasticSearchClient
+from jarvis_search.index import EsIndex, EsQueryObject
+
+def measure(index, count):
+    latencies = []
+    for i in xrange(count):
+        start = time.time()
+        index.query(EsQueryObject('*', 'product', limit=10))
+        latencies.append(time.time() - start)
+    return {'p50': percentile(latencies, 0.5), 'p99': percentile(latencies, 0.99)}
+
+def run(count=300, ports=(19201, 19202)):
+    clusters = [FakeCluster(port=port, latency=0.1, latency_rate=0.05, seed=port).start() for port in ports]
+    client = index_module.es_client_conn
+    try:
+        for cluster in clusters:
+            for i in xrange(100):
+                cluster.documents[('benchmark_hedging', 'product', str(i))] = {'_rank': i}
+        index_module.es_client_conn = ElasticSearchClient(servers=[{'host': '127.0.0.1', 'port': port} for port in ports])
+        results = {}
+        results['plain'] = measure(EsIndex('benchmark_hedging'), count)
+        results['hedged'] = measure(EsIndex('benchmark_hedging', hedge_delay=0.01), count)
+
+        index_module.es_client_conn = ElasticSearchClient(servers=[{'host': '127.0.0.1', 'port': port} for port in ports])
+        clusters[0].latency_rate = 1.0
+        clusters[0].latency = 0.02
+        clusters[1].latency = 0.0
+        requests = [cluster.requests for cluster in clusters]
+        measure(EsIndex('benchmark_hedging'), count)
+        slow, fast = [cluster.requests - before for cluster, before in zip(clusters, requests)]
+        results['slow_node_share'] = float(slow) / (slow + fast)
+        return results
+    finally:
+        index_module.es_client_conn = client
+        for cluster in clusters:
+            cluster.stop()
+
+if __name__ == '__main__':
+    results = run()
+    for name in ('plain', 'hedged'):
+        print "%-6s p50 %6.1fms p99 %6.1fms" % (name, results[name]['p50'] * 1e3, results[name]['p99'] * 1e3)
+    print "reads sent to the slow node: %.1f%%" % (results['slow_node_share'] * 100)
@@ -0,0 +1,73 @@
+#
+#       (C) 2013 Varun Mittal <varunmittal91@gmail.com>
+#       JARVIS program is distributed under the terms of the GNU General Public License v3
+#
+#       This file is part of JARVIS.
+#
+#       JARVIS is free software: you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation version 3 of the License.
+#
+#       JARVIS is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with JARVIS.  If not, see <http://www.gnu.org/licenses/>.
+#
+# usage: python -m benchmarks.bench_hydration
+# cost per hit of building an EsResultObject from a search response, eager against lazy.
+
+import sys
+
+from . import timed
+from jarvis_search.index import EsResultObject
+
+def make_response(count=1000, fields=10):
+    hits = []
+    for i in xrange(count):
+        source = dict([("field_%d" % j, "value %d %d" % (i, j)) for j in xrange(fields)])
+        source['_rank'] = i
+        hits.append({'_index': 'benchmark', '_type': 'product', '_id': str(i), '_score': 1.0, '_source': source})
+    return {'hits': {'total': count, 'hits': hits}}
+
+def deep_size(obj, seen=None):
+    seen = seen if seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum([deep_size(key, seen) + deep_size(value, seen) for key, value in obj.items()])
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum([deep_size(item, seen) for item in obj])
+    if hasattr(obj, '__dict__'):
+        size += deep_size(obj.__dict__, seen)
+    for slot in getattr(type(obj), '__slots__', ()):
+        if hasattr(obj, slot):
+            size += deep_size(getattr(obj, slot), seen)
+    return size
+
+def run(count=1000):
+    response = make_response(count)
+    results = {}
+    for name, lazy in (('eager', False), ('lazy', True)):
+        results['%s_build' % name] = timed(lambda: EsResultObject(response, lazy=lazy), repeat=5) / count
+        results['%s_build_match_only' % name] = timed(lambda: EsResultObject(response, match_only=True, lazy=lazy), repeat=5) / count
+        results['%s_read_rank' % name] = timed(lambda: [document.rank for document in EsResultObject(response, lazy=lazy).documents], repeat=5) / count
+        # the response itself is shared by both paths, only what is built on top of it is counted
+        seen = set([id(hit['_source']) for hit in response['hits']['hits']])
+        for hit in response['hits']['hits']:
+            seen.update([id(value) for value in hit['_source'].values()])
+        result = EsResultObject(response, lazy=lazy)
+        [document.rank for document in result.documents]
+        results['%s_bytes' % name] = deep_size(result.documents, seen) / count
+    return results
+
+if __name__ == '__main__':
+    results = run()
+    for name in ('eager', 'lazy'):
+        print "%-5s build %6.2fus/hit, match_only %6.2fus/hit, read rank %6.2fus/hit, %5d bytes/hit" % (name,
+            results['%s_build' % name] * 1e6, results['%s_build_match_only' % name] * 1e6,
+            results['%s_read_rank' % name] * 1e6, results['%s_bytes' % name])
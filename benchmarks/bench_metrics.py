@@ -0,0 +1,69 @@
+#
+#       (C) 2013 Varun Mittal <varunmittal91@gmail.com>
+#       JARVIS program is distributed under the terms of the GNU General Public License v3
+#
+#       This file is part of JARVIS.
+#
+#       JARVIS is free software: you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation version 3 of the License.
+#
+#       JARVIS is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with JARVIS.  If not, see <http://www.gnu.org/licenses/>.
+#
+# usage: python -m benchmarks.bench_metrics
+# cost of the instrumentation hooks: tokenize_string and queries against a local stand-in node
+# with no sink installed and with the in-memory sink, plus the bare cost of a disabled hook.
+
+from . import timed
+from .fake_cluster import FakeCluster
+from .bench_tokenize import make_titles
+import jarvis_search.index as index_module
+from jarvis_search import metrics
+from jarvis_search.conn import ElasticSearchClient
+from jarvis_search.index import EsIndex, EsQueryObject
+from jarvis_search.tokenizer import tokenize_string
+
+@metrics.timed('benchmark')
+def hooked():
+    pass
+
+def plain():
+    pass
+
+def run(count=5000, queries=300, port=19205):
+    titles = make_titles(count)
+    results = {}
+    sink = metrics.getSink()
+    cluster = FakeCluster(port=port).start()
+    client = index_module.es_client_conn
+    try:
+        for i in xrange(100):
+            cluster.documents[('benchmark_metrics', 'product', str(i))] = {'_rank': i}
+        index_module.es_client_conn = ElasticSearchClient(servers=[{'host': '127.0.0.1', 'port': port}])
+        index = EsIndex('benchmark_metrics')
+        query = EsQueryObject('*', 'product', limit=10)
+        for name, new_sink in (('disabled', None), ('memory', metrics.MemorySink())):
+            metrics.setSink(new_sink)
+            results['%s_hook' % name] = (timed(lambda: [hooked() for i in xrange(count)]) - timed(lambda: [plain() for i in xrange(count)])) / count
+            results['%s_tokenize' % name] = timed(lambda: [tokenize_string(title) for title in titles], repeat=3) / count
+            results['%s_query' % name] = timed(lambda: index.query(query), repeat=3, number=queries)
+        results['snapshot'] = new_sink.snapshot()
+    finally:
+        metrics.setSink(sink)
+        index_module.es_client_conn = client
+        cluster.stop()
+    return results
+
+if __name__ == '__main__':
+    results = run()
+    for name in ('disabled', 'memory'):
+        print "%-8s hook %6.3fus, tokenize_string %6.2fus/title, query %6.3fms" % (name,
+            results['%s_hook' % name] * 1e6, results['%s_tokenize' % name] * 1e6, results['%s_query' % name] * 1e3)
+    for name, stats in sorted(results['snapshot']['histograms'].items()):
+        print "%-12s count %6d p50 %.6f p99 %.6f" % (name, stats['count'], stats['p50'], stats['p99'])
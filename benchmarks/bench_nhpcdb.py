@@ -0,0 +1,167 @@
+#
+#       (C) 2013 Varun Mittal <varunmittal91@gmail.com>
+#       JARVIS program is distributed under the terms of the GNU General Public License v3
+#
+#       This file is part of JARVIS.
+#
+#       JARVIS is free software: you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation version 3 of the License.
+#
+#       JARVIS is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with JARVIS.  If not, see <http://www.gnu.org/licenses/>.
+#
+# usage: python -m benchmarks.bench_nhpcdb
+# Models.put statement generation, hydration of rows into models, put and put_multi through CassandraClient on a fake session
+# (when the driver is installed), the zlib json and framed round trips of conn_webi and put_multi and query
+# over both against a local stand-in for the nhpcdb web endpoint.
+
+import json
+import time
+import zlib
+from copy import deepcopy
+
+from . import timed
+from .fake_cassandra import install, FakeCassandraCluster, FakeNhpcDBServer
+from .bench_tokenize import make_titles
+driver = install()
+from jarvis_search.nhpcdb import model
+from jarvis_search.nhpcdb.model import Models, StringProperty, IntegerProperty, DateTimeProperty, JsonProperty
+from jarvis_search.nhpcdb import wire
+from jarvis_search.nhpcdb.conn_common import db_opts, JsonOpsWriter
+from jarvis_search.nhpcdb.conn_webi import CassandraClientWeb
+
+class BenchProduct(Models):
+    title = StringProperty(indexed=True)
+    price = IntegerProperty()
+    created = DateTimeProperty(auto_now_add=True)
+    details = JsonProperty(compressed=True)
+
+def make_models(count):
+    return [BenchProduct(title=title, price=i, details=json.dumps({'title': title, 'tags': title.split()}))
+            for i, title in enumerate(make_titles(count))]
+
+def make_rows(models):
+    rows = []
+    for instance in models:
+        opt = instance._Models__getDbOpt()
+        row = {}
+        for (key, _type, _indexed), value in zip(opt['table_schema'], opt['rows']):
+            if isinstance(value, buffer):
+                value = str(value)
+            elif value == 'null':
+                value = None
+            elif value.startswith("'"):
+                value = value[1:-1]
+            else:
+                value = long(value)
+            row[key] = value
+        rows.append(row)
+    return rows
+
+# hydration as NhpcDBQueryObject did it before Models.fromRows, kept for comparison
+def legacy_hydrate(model_t, rows, projection):
+    results = []
+    for row in rows:
+        new_model = deepcopy(model_t)(key=row['key'])
+        new_model.loadRow(row, projection)
+        results.append(new_model)
+    return results
+
+def run(count=2000, hydrate_count=10000, port=19211):
+    models = make_models(count)
+    results = {'models': count}
+    results['build_model'] = timed(lambda: make_models(count), repeat=3) / count
+    results['statement_per_model'] = timed(lambda: [instance.put(db_opts()) for instance in models], repeat=3) / count
+
+    if driver:
+        session = FakeCassandraCluster.sessions[-1]
+        session.reset()
+        results['session_put_per_model'] = timed(lambda: [instance.put() for instance in models], repeat=1) / count
+        results['session_statements'] = len(session.statements)
+        results['session_prepared'] = len(session.prepared)
+        results['session_put_multi_per_model'] = timed(lambda: model.put_multi(models), repeat=1) / count
+
+    rows = make_rows(make_models(hydrate_count))
+    results['hydrate_legacy_per_row'] = timed(lambda: legacy_hydrate(BenchProduct, rows, None), repeat=3) / hydrate_count
+    results['hydrate_per_row'] = timed(lambda: BenchProduct.fromRows(rows), repeat=3) / hydrate_count
+    hydrated = BenchProduct.fromRows(rows)
+    read = lambda: [(instance.title, instance.price, instance.created, instance.details) for instance in hydrated]
+    results['read_per_row'] = timed(read, repeat=1) / hydrate_count
+    results['reread_per_row'] = timed(read, repeat=3) / hydrate_count
+
+    collector = db_opts()
+    for instance in models:
+        instance.put(collector)
+    payloads = [chunk.dumps() for opts, chunk in collector.get_chunks(JsonOpsWriter)]
+    compressed = [zlib.compress(payload) for payload in payloads]
+    results['payload_bytes'] = sum([len(payload) for payload in payloads])
+    results['compressed_bytes'] = sum([len(payload) for payload in compressed])
+    results['compress_per_model'] = timed(lambda: [zlib.compress(payload) for payload in payloads]) / count
+    results['decompress_per_model'] = timed(lambda: [json.loads(zlib.decompress(payload)) for payload in compressed]) / count
+
+    framed = [chunk.dumps() for opts, chunk in collector.get_chunks(wire.OpsWriter)]
+    results['framed_bytes'] = sum([len(payload) for payload in framed])
+    results['frame_per_model'] = timed(lambda: [chunk.dumps() for opts, chunk in collector.get_chunks(wire.OpsWriter)]) / count
+    results['unframe_per_model'] = timed(lambda: [list(wire.iterFrames(payload)) for payload in framed]) / count
+
+    server = FakeNhpcDBServer(port=port).start()
+    conn = model.cassandra_conn
+    try:
+        for protocol in ('json', 'binary'):
+            server.tables = {}
+            server.requests = server.bytes = 0
+            client = CassandraClientWeb('nhpcdb', servers=[{'host': '127.0.0.1', 'port': port, 'http_auth': 'benchmark:benchmark'}])
+            client.protocol = protocol
+            model.cassandra_conn = client
+            start = time.time()
+            model.put_multi(models)
+            results['web_%s_put_multi_per_model' % protocol] = (time.time() - start) / count
+            results['web_%s_requests' % protocol] = server.requests
+            results['web_%s_bytes' % protocol] = server.bytes
+            start = time.time()
+            rows = client.query('BenchProduct', None, None, count)
+            results['web_%s_query_per_row' % protocol] = (time.time() - start) / max(1, len(rows))
+        # chunks of 200 rows against a server taking 20ms per request, posted one at a time and concurrently
+        server.latency = 0.02
+        for concurrency in (1, 4):
+            client = CassandraClientWeb('nhpcdb', servers=[{'host': '127.0.0.1', 'port': port, 'http_auth': 'benchmark:benchmark'}])
+            client.put_concurrency = concurrency
+            collector = db_opts(max_rows=200)
+            for instance in models:
+                instance.put(collector)
+            start = time.time()
+            rows = client.put_multi(collector)
+            results['web_put_multi_%d_per_model' % concurrency] = (time.time() - start) / count
+            assert rows == count, rows
+    finally:
+        model.cassandra_conn = conn
+        server.stop()
+    return results
+
+if __name__ == '__main__':
+    results = run()
+    print "build model:         %6.2fus" % (results['build_model'] * 1e6)
+    print "statement per model: %6.2fus" % (results['statement_per_model'] * 1e6)
+    print "hydrate:             %6.2fus per row, legacy %6.2fus" % (results['hydrate_per_row'] * 1e6, results['hydrate_legacy_per_row'] * 1e6)
+    print "read every column:   %6.2fus per row, again %6.2fus" % (results['read_per_row'] * 1e6, results['reread_per_row'] * 1e6)
+    if 'session_put_per_model' in results:
+        print "session put:         %6.2fus per model, %d statements, %d prepared" % (results['session_put_per_model'] * 1e6,
+            results['session_statements'], results['session_prepared'])
+        print "session put_multi:   %6.2fus per model" % (results['session_put_multi_per_model'] * 1e6)
+    print "payload:             %d bytes, %d compressed (%.1fx)" % (results['payload_bytes'], results['compressed_bytes'],
+        float(results['payload_bytes']) / results['compressed_bytes'])
+    print "compress:            %6.2fus per model, decompress %6.2fus" % (results['compress_per_model'] * 1e6, results['decompress_per_model'] * 1e6)
+    print "framed:              %d bytes, frame %6.2fus per model, unframe %6.2fus" % (results['framed_bytes'],
+        results['frame_per_model'] * 1e6, results['unframe_per_model'] * 1e6)
+    for protocol in ('json', 'binary'):
+        print "web %-6s put_multi: %6.2fus per model, %d bytes over %d requests, query %6.2fus per row" % (protocol,
+            results['web_%s_put_multi_per_model' % protocol] * 1e6, results['web_%s_bytes' % protocol],
+            results['web_%s_requests' % protocol], results['web_%s_query_per_row' % protocol] * 1e6)
+    print "web put_multi, 20ms per request: %6.2fus per model one chunk at a time, %6.2fus four at a time" % (
+        results['web_put_multi_1_per_model'] * 1e6, results['web_put_multi_4_per_model'] * 1e6)
@@ -0,0 +1,44 @@
+#
+#       (C) 2013 Varun Mittal <varunmittal91@gmail.com>
+#       JARVIS program is distributed under the terms of the GNU General Public License v3
+#
+#       This file is part of JARVIS.
+#
+#       JARVIS is free software: you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation version 3 of the License.
+#
+#       JARVIS is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with JARVIS.  If not, see <http://www.gnu.org/licenses/>.
+#
+# usage: python -m benchmarks.bench_payload
+
+import simplejson as json
+
+from .bench_tokenize import make_titles
+from jarvis_search.scored_document import EsSearchDocument, EsStringField, EsTextField
+
+def bulk_size(documents, index_name="benchmark"):
+    size = 0
+    for document in documents:
+        doc = document.getDoc(index_name)
+        header = {'index': {'_index': index_name, '_type': doc['doc_type'], '_id': doc['id']}}
+        size += len(json.dumps(header)) + len(json.dumps(doc['body'], default=str)) + 2
+    return size
+
+def run(count=5000):
+    titles = make_titles(count)
+    client = [EsSearchDocument(doc_type='product', rank=1, fields=[EsStringField(name='title', value=title)]) for title in titles]
+    server = [EsSearchDocument(doc_type='product', rank=1, fields=[EsTextField(name='title', value=title)]) for title in titles]
+    return {'client_ngram_bytes': bulk_size(client), 'server_ngram_bytes': bulk_size(server)}
+
+if __name__ == '__main__':
+    results = run()
+    print "bulk bytes, client side grams: %d" % results['client_ngram_bytes']
+    print "bulk bytes, server side grams: %d" % results['server_ngram_bytes']
+    print "ratio: %.1fx" % (float(results['client_ngram_bytes']) / results['server_ngram_bytes'])
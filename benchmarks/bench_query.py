@@ -0,0 +1,65 @@
+#
+#       (C) 2013 Varun Mittal <varunmittal91@gmail.com>
+#       JARVIS program is distributed under the terms of the GNU General Public License v3
+#
+#       This file is part of JARVIS.
+#
+#       JARVIS is free software: you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation version 3 of the License.
+#
+#       JARVIS is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with JARVIS.  If not, see <http://www.gnu.org/licenses/>.
+#
+# usage: python -m benchmarks.bench_query
+# latency percentiles of query, query_multi and get_multi against a local stand-in node.
+
+import time
+
+from . import percentile
+from .fake_cluster import FakeCluster
+import jarvis_search.index as index_module
+from jarvis_search.conn import ElasticSearchClient
+from jarvis_search.index import EsIndex, EsQueryObject
+
+def latencies(func, count):
+    values = []
+    for i in xrange(count):
+        start = time.time()
+        func()
+        values.append(time.time() - start)
+    return {
+        'p50': percentile(values, 0.5),
+        'p90': percentile(values, 0.9),
+        'p99': percentile(values, 0.99),
+        'max': max(values),
+    }
+
+def run(count=500, documents=1000, port=19207):
+    cluster = FakeCluster(port=port).start()
+    client = index_module.es_client_conn
+    try:
+        for i in xrange(documents):
+            cluster.documents[('benchmark_query', 'product', str(i))] = {'_rank': i, 'title': "product %d" % i}
+        index_module.es_client_conn = ElasticSearchClient(servers=[{'host': '127.0.0.1', 'port': port}])
+        index = EsIndex('benchmark_query')
+        queries = [EsQueryObject('*', 'product', limit=25, offset=i * 25) for i in xrange(10)]
+        ids = [str(i) for i in xrange(0, documents, 10)]
+        return {
+            'query': latencies(lambda: index.query(queries[0]), count),
+            'query_multi_10': latencies(lambda: index.query_multi(queries), count / 10),
+            'get_multi_100': latencies(lambda: index.get_multi(ids, 'product'), count / 10),
+        }
+    finally:
+        index_module.es_client_conn = client
+        cluster.stop()
+
+if __name__ == '__main__':
+    results = run()
+    for name in sorted(results):
+        print "%-15s p50 %6.2fms p90 %6.2fms p99 %6.2fms" % (name, results[name]['p50'] * 1e3, results[name]['p90'] * 1e3, results[name]['p99'] * 1e3)
@@ -0,0 +1,117 @@
+#
+#       (C) 2013 Varun Mittal <varunmittal91@gmail.com>
+#       JARVIS program is distributed under the terms of the GNU General Public License v3
+#
+#       This file is part of JARVIS.
+#
+#       JARVIS is free software: you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation version 3 of the License.
+#
+#       JARVIS is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with JARVIS.  If not, see <http://www.gnu.org/licenses/>.
+#
+# usage: python -m benchmarks.bench_retry
+# indexes into a fake cluster rejecting a share of bulk items and requests with 429,
+# every document has to land while only rejected items are resent. check() runs first and
+# asserts the retry behaviour item by item.
+
+import time
+
+from .fake_cluster import FakeCluster
+from .bench_tokenize import make_titles
+import jarvis_search.index as index_module
+from jarvis_search.conn import ElasticSearchClient
+from jarvis_search.index import EsIndex
+from jarvis_search.retry import RetryPolicy
+from jarvis_search.exceptions import IndexException
+from jarvis_search.scored_document import EsSearchDocument, EsTextField
+
+def makeDocuments(count):
+    return [EsSearchDocument(doc_type='product', rank=i, id=str(i), fields=[EsTextField(name='title', value=title)])
+            for i, title in enumerate(make_titles(count))]
+
+def putAll(name, policy, count):
+    # (ids, error, keys) of indexing count documents, error is the IndexException raised if any
+    index = EsIndex(name, retry_policy=policy)
+    keys = [(name, 'product', str(i)) for i in xrange(count)]
+    try:
+        return index.put(makeDocuments(count)), None, keys
+    except IndexException as e:
+        return None, e, keys
+
+def scenario(port, **options):
+    # a cluster of its own and a client that has never connected to another one
+    cluster = FakeCluster(port=port, **options).start()
+    index_module.es_client_conn = ElasticSearchClient(servers=[{'host': '127.0.0.1', 'port': port}])
+    return cluster
+
+def check(count=500, ports=(19215, 19216, 19217)):
+    client = index_module.es_client_conn
+    # items rejected with 429 or 503 are resent alone until they land, accepted ones never again
+    cluster = scenario(ports[0], reject_rate=0.3, reject_statuses=(429, 503), seed=2)
+    try:
+        policy = RetryPolicy(max_retries=20, backoff=0.001, max_backoff=0.01, budget=10000)
+        ids, error, keys = putAll('check_resend', policy, count)
+        assert error is None and len(ids) == count, error
+        assert all([key in cluster.documents for key in keys])
+        assert all([cluster.attempts[key] == cluster.rejections.get(key, 0) + 1 for key in keys])
+        assert sum([cluster.attempts[key] for key in keys]) == count + cluster.rejected
+        assert sorted(cluster.rejected_statuses.keys()) == [429, 503] and policy.retries > 0
+    finally:
+        cluster.stop()
+    # other item errors are reported without a resend, the batch holding them raises
+    cluster = scenario(ports[1], reject_rate=0.3, reject_statuses=(400,), seed=3)
+    try:
+        policy = RetryPolicy(max_retries=20, backoff=0.001, max_backoff=0.01, budget=10000)
+        ids, error, keys = putAll('check_fatal', policy, count)
+        assert error is not None and policy.retries == 0, policy.retries
+        assert cluster.attempts and all([attempts == 1 for key, attempts in cluster.attempts.items()])
+    finally:
+        cluster.stop()
+    # with every item rejected, retries stop once the budget is spent and the failure surfaces
+    cluster = scenario(ports[2], reject_rate=1.0, reject_statuses=(429, 503))
+    try:
+        policy = RetryPolicy(max_retries=20, backoff=0.001, max_backoff=0.01, budget=3)
+        ids, error, keys = putAll('check_budget', policy, 50)
+        assert error is not None
+        assert 3 <= policy.retries < policy.max_retries, policy.retries
+        assert all([cluster.attempts[key] == policy.retries + 1 for key in keys])
+        assert not [key for key in keys if key in cluster.documents]
+    finally:
+        cluster.stop()
+        index_module.es_client_conn = client
+
+def run(count=5000, reject_rate=0.2, reject_request_rate=0.05):
+    cluster = FakeCluster(reject_rate=reject_rate, reject_request_rate=reject_request_rate).start()
+    try:
+        policy = RetryPolicy(max_retries=10, backoff=0.001, max_backoff=0.01, budget=10000)
+        index = EsIndex('benchmark_retry', retry_policy=policy)
+        documents = makeDocuments(count)
+        start = time.time()
+        ids = index.put(documents)
+        elapsed = time.time() - start
+        stored = len([key for key in cluster.documents if key[0] == 'benchmark_retry'])
+        return {
+            'documents': count,
+            'indexed': len(ids),
+            'stored': stored,
+            'rejected': cluster.rejected,
+            'requests': cluster.requests,
+            'retries': policy.retries,
+            'seconds': elapsed,
+        }
+    finally:
+        cluster.stop()
+
+if __name__ == '__main__':
+    check()
+    results = run()
+    assert results['indexed'] == results['stored'] == results['documents'], results
+    print "indexed %(indexed)d/%(documents)d documents in %(seconds).2fs" % results
+    print "%(rejected)d rejections, %(retries)d retries over %(requests)d requests" % results
@@ -0,0 +1,73 @@
+#
+#       (C) 2013 Varun Mittal <varunmittal91@gmail.com>
+#       JARVIS program is distributed under the terms of the GNU General Public License v3
+#
+#       This file is part of JARVIS.
+#
+#       JARVIS is free software: you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation version 3 of the License.
+#
+#       JARVIS is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with JARVIS.  If not, see <http://www.gnu.org/licenses/>.
+#
+# usage: python -m benchmarks.bench_tokenize
+
+import random
+
+from . import timed
+from jarvis_search.tokenizer import EsTokenizer, stop_words
+
+legacy_stop_words = list(stop_words)
+
+# tokenize_string as it was before the tokenizer engine, kept for comparison
+def legacy_tokenize_string(phrase):
+    a = []
+    for word in phrase.split():
+        if len(word) > 12 or word in legacy_stop_words:
+            continue
+        for j in xrange(3, len(word)):
+            for i in xrange(0, len(word)-j+1):
+                a.append(word[i:i+j])
+    a.extend(phrase.split())
+    return a
+
+def make_titles(count, seed=1):
+    rand = random.Random(seed)
+    vocabulary = ["".join([rand.choice("abcdefghijklmnopqrstuvwxyz") for i in xrange(rand.randint(3, 11))]) for j in xrange(2000)]
+    vocabulary.extend(legacy_stop_words[:50])
+    return [" ".join([rand.choice(vocabulary) for i in xrange(rand.randint(4, 12))]) for j in xrange(count)]
+
+def run(count=5000):
+    # cold runs start from an empty gram cache, per title for tokenize and per batch for
+    # tokenize_batch, cached runs repeat a batch on a tokenizer that has seen it
+    titles = make_titles(count)
+    results = {}
+    results['legacy'] = timed(lambda: [legacy_tokenize_string(title) for title in titles], repeat=3)
+    results['tokenize'] = timed(lambda: [EsTokenizer().tokenize(title) for title in titles], repeat=3)
+    results['tokenize_batch_cold'] = timed(lambda: EsTokenizer().tokenize_batch(titles), repeat=3)
+    tokenizer = EsTokenizer()
+    tokenizer.tokenize_batch(titles)
+    results['tokenize_batch'] = timed(lambda: tokenizer.tokenize_batch(titles), repeat=3)
+    results['edge_ngram_batch_cold'] = timed(lambda: EsTokenizer(strategy='edge_ngram').tokenize_batch(titles), repeat=3)
+    edge_tokenizer = EsTokenizer(strategy='edge_ngram')
+    edge_tokenizer.tokenize_batch(titles)
+    results['edge_ngram_batch'] = timed(lambda: edge_tokenizer.tokenize_batch(titles), repeat=3)
+    legacy_tokens = sum([len(legacy_tokenize_string(title)) for title in titles])
+    tokens = sum([len(tokens) for tokens in tokenizer.tokenize_batch(titles)])
+    results['legacy_tokens'] = legacy_tokens
+    results['tokens'] = tokens
+    return results
+
+if __name__ == '__main__':
+    results = run()
+    print "titles/s legacy:           %.0f" % (5000 / results['legacy'])
+    print "titles/s tokenize (cold):  %.0f" % (5000 / results['tokenize'])
+    print "titles/s tokenize_batch:   %.0f cold, %.0f cached" % (5000 / results['tokenize_batch_cold'], 5000 / results['tokenize_batch'])
+    print "titles/s edge_ngram:       %.0f cold, %.0f cached" % (5000 / results['edge_ngram_batch_cold'], 5000 / results['edge_ngram_batch'])
+    print "speedup: %.1fx cold, %.1fx cached, tokens %d -> %d" % (results['legacy'] / results['tokenize'], results['legacy'] / results['tokenize_batch'], results['legacy_tokens'], results['tokens'])
@@ -0,0 +1,286 @@
+#
+#       (C) 2013 Varun Mittal <varunmittal91@gmail.com>
+#       JARVIS program is distributed under the terms of the GNU General Public License v3
+#
+#       This file is part of JARVIS.
+#
+#       JARVIS is free software: you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation version 3 of the License.
+#
+#       JARVIS is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with JARVIS.  If not, see <http://www.gnu.org/licenses/>.
+#
+# in-process stand-ins for nhpcdb backends: FakeSession records the statements CassandraClient
+# executes, FakeNhpcDBServer speaks both the framed and the compressed json protocol
+# CassandraClientWeb posts to.
+
+import re
+import json
+import time
+import zlib
+import threading
+from collections import deque
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+FAKE_NHPCDB_PORT = 19210
+
+class FakeResponseFuture:
+    # the part of the driver's ResponseFuture that CassandraClient and execute_concurrent use. the
+    # response is delivered on the session's event thread once the caller asks for it through
+    # result() or a callback, as a round trip would, callbacks added once it is done run at once on
+    # the caller's thread as with the driver.
+    has_more_pages = False
+    _col_names = None
+    _col_types = None
+
+    def __init__(self, session, result=None, error=None):
+        self.__session = session
+        self.__response = (result, error)
+        self.__sent = False
+        self.__lock = threading.Lock()
+        self.__event = threading.Event()
+        self.__callbacks = []
+        self.__errbacks = []
+        self.__result = None
+        self.__error = None
+    def __send(self):
+        with self.__lock:
+            if self.__sent:
+                return
+            self.__sent = True
+        self.__session.submit(self.__complete, *self.__response)
+    def __complete(self, result, error):
+        with self.__lock:
+            self.__result = result
+            self.__error = error
+            self.__event.set()
+            callbacks = self.__errbacks if error else self.__callbacks
+            self.__callbacks = []
+            self.__errbacks = []
+        for fn, args, kwargs in callbacks:
+            fn(error or result, *args, **kwargs)
+    def result(self, timeout=None):
+        self.__send()
+        self.__event.wait(timeout)
+        if self.__error:
+            raise self.__error
+        return self.__result
+    def __addCallback(self, callbacks, fn, args, kwargs):
+        with self.__lock:
+            if not self.__event.is_set():
+                callbacks.append((fn, args, kwargs))
+                return False
+        return True
+    def add_callback(self, fn, *args, **kwargs):
+        if self.__addCallback(self.__callbacks, fn, args, kwargs) and not self.__error:
+            fn(self.__result, *args, **kwargs)
+        self.__send()
+        return self
+    def add_errback(self, fn, *args, **kwargs):
+        if self.__addCallback(self.__errbacks, fn, args, kwargs) and self.__error:
+            fn(self.__error, *args, **kwargs)
+        self.__send()
+        return self
+    def add_callbacks(self, callback, errback, callback_args=(), callback_kwargs=None, errback_args=(), errback_kwargs=None):
+        if self.__addCallback(self.__callbacks, callback, callback_args, callback_kwargs or {}) and not self.__error:
+            callback(self.__result, *callback_args, **(callback_kwargs or {}))
+        if self.__addCallback(self.__errbacks, errback, errback_args, errback_kwargs or {}) and self.__error:
+            errback(self.__error, *errback_args, **(errback_kwargs or {}))
+        self.__send()
+    def clear_callbacks(self):
+        with self.__lock:
+            self.__callbacks = []
+            self.__errbacks = []
+
+class FakeResultSet:
+    def __init__(self, current_rows, paging_state=None):
+        self.current_rows = current_rows
+        self.paging_state = paging_state
+    def __iter__(self):
+        return iter(self.current_rows)
+
+class FakePagedFuture:
+    # pages through rows fetch_size at a time, the paging state is the offset of the next page
+    def __init__(self, rows, fetch_size, paging_state=None):
+        self.rows = rows
+        self.fetch_size = fetch_size
+        self.start = int(paging_state or 0)
+    @property
+    def has_more_pages(self):
+        return self.start + self.fetch_size < len(self.rows)
+    def result(self):
+        state = str(self.start + self.fetch_size) if self.has_more_pages else None
+        return FakeResultSet(self.rows[self.start:self.start + self.fetch_size], state)
+    def start_fetching_next_page(self):
+        self.start += self.fetch_size
+
+class FakePreparedStatement:
+    def __init__(self, query_string, values=None):
+        self.query_string = query_string
+        self.values = values
+        self.fetch_size = None
+    def bind(self, values):
+        return FakePreparedStatement(self.query_string, values)
+
+class FakeSession:
+    # statements are kept verbatim with their bound values, selects answer with the rows of the
+    # table set in rows
+    def __init__(self, keyspace=None):
+        self.keyspace = keyspace
+        self.row_factory = None
+        self.statements = []
+        self.prepared = []
+        self.rows = {}
+        self.lock = threading.Lock()
+        self.__events = deque()
+        self.__events_lock = threading.Lock()
+        self.__events_running = False
+    def set_keyspace(self, keyspace):
+        self.keyspace = keyspace
+    def prepare(self, query):
+        with self.lock:
+            self.prepared.append(query)
+        return FakePreparedStatement(query)
+    def execute(self, query, parameters=None, **options):
+        if parameters is None:
+            parameters = getattr(query, 'values', None)
+        with self.lock:
+            self.statements.append((query, parameters))
+        query_string = getattr(query, 'query_string', query)
+        match = re.match(r"\s*select .* from\s+(\w+)", query_string, re.I)
+        if match:
+            return list(self.rows.get(match.group(1), []))
+        return []
+    def execute_async(self, query, parameters=None, paging_state=None, **options):
+        if getattr(query, 'fetch_size', None):
+            return FakePagedFuture(self.execute(query, parameters), query.fetch_size, paging_state)
+        try:
+            return FakeResponseFuture(self, self.execute(query, parameters))
+        except Exception as e:
+            return FakeResponseFuture(self, error=e)
+    def submit(self, fn, *args, **kwargs):
+        # runs fn on the event thread, in order, as the driver's connections deliver responses. the
+        # thread is started on demand and ends once there is nothing left to run.
+        with self.__events_lock:
+            self.__events.append((fn, args, kwargs))
+            if self.__events_running:
+                return
+            self.__events_running = True
+        thread = threading.Thread(target=self.__runEvents)
+        thread.daemon = True
+        thread.start()
+    def __runEvents(self):
+        while True:
+            with self.__events_lock:
+                if not self.__events:
+                    self.__events_running = False
+                    return
+                fn, args, kwargs = self.__events.popleft()
+            fn(*args, **kwargs)
+    def reset(self):
+        with self.lock:
+            self.statements = []
+            self.prepared = []
+
+class FakeCassandraCluster:
+    sessions = []
+
+    def __init__(self, contact_points=None, **options):
+        self.contact_points = contact_points
+    def connect(self, keyspace=None):
+        session = FakeSession(keyspace)
+        self.sessions.append(session)
+        return session
+
+def install():
+    # has to run before jarvis_search.nhpcdb is imported, False when the driver is not installed
+    # and nhpcdb falls back to CassandraClientWeb
+    try:
+        import cassandra.cluster
+    except ImportError:
+        return False
+    cassandra.cluster.Cluster = FakeCassandraCluster
+    return True
+
+class FakeNhpcDBServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port=FAKE_NHPCDB_PORT, latency=0.0):
+        HTTPServer.__init__(self, ('127.0.0.1', port), FakeNhpcDBHandler)
+        self.url = "http://127.0.0.1:%d/" % port
+        self.latency = latency
+        self.tables = {}
+        self.requests = 0
+        self.bytes = 0
+        self.lock = threading.Lock()
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+    def put(self, data):
+        # a single put or the list of puts of a put_multi batch, which carries the keyword
+        # arguments of put as queued by Models.put. rows are kept as dicts by column.
+        if isinstance(data, dict):
+            data = [data]
+        with self.lock:
+            for opt in data:
+                schema = opt.get('schema') or opt.get('table_schema')
+                row = dict(zip([column[0] for column in schema], opt['rows']))
+                self.tables.setdefault(opt.get('t_name') or opt.get('table_name'), []).append(row)
+        return {'rows': len(data), 'failed': []}
+    def query(self, data):
+        with self.lock:
+            rows = self.tables.get(data['t_name'], [])
+            if data.get('limit'):
+                rows = rows[:data['limit']]
+            return list(rows)
+
+class FakeNhpcDBHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body go out in separate writes, with nagle the client waits on a delayed ack
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+    def do_POST(self):
+        server = self.server
+        payload = self.rfile.read(int(self.headers.getheader('content-length') or 0))
+        with server.lock:
+            server.requests += 1
+            server.bytes += len(payload)
+        if server.latency:
+            time.sleep(server.latency)
+        path = self.path.strip('/')
+        if path not in ('nhpcdb/put', 'nhpcdb/query'):
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        # imported here, importing jarvis_search.nhpcdb before install() would connect for real
+        from jarvis_search.nhpcdb import wire
+        from jarvis_search.nhpcdb.blob import toHexLiteral
+        if self.headers.getheader('content-type') == wire.content_type:
+            if path == 'nhpcdb/put':
+                body = wire.dumps(wire.status_frame, [server.put(list(wire.loadOps(payload)))])
+            elif path == 'nhpcdb/query':
+                body = wire.dumpRows(server.query([value for kind, value in wire.iterFrames(payload)][0]))
+        elif path == 'nhpcdb/put':
+            body = zlib.compress(json.dumps(server.put(json.loads(zlib.decompress(payload)))))
+        elif path == 'nhpcdb/query':
+            body = zlib.compress(json.dumps(server.query(json.loads(zlib.decompress(payload))), default=toHexLiteral))
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
@@ -0,0 +1,232 @@
+#
+#       (C) 2013 Varun Mittal <varunmittal91@gmail.com>
+#       JARVIS program is distributed under the terms of the GNU General Public License v3
+#
+#       This file is part of JARVIS.
+#
+#       JARVIS is free software: you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation version 3 of the License.
+#
+#       JARVIS is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with JARVIS.  If not, see <http://www.gnu.org/licenses/>.
+#
+# in-process stand-in for an elasticsearch node, enough of the rest api for EsIndex.
+# rejections and latency can be injected to exercise retries and host selection.
+
+import time
+import socket
+import random
+import threading
+import urlparse
+import simplejson as json
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+FAKE_ES_PORT = 19200
+
+class FakeCluster(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    # bulk items are rejected with reject_rate, each with one of reject_statuses. attempts and
+    # rejections count the bulk items received and rejected per (index, type, id), rejected_statuses
+    # the rejected items per status.
+    def __init__(self, port=FAKE_ES_PORT, reject_rate=0.0, reject_request_rate=0.0, latency=0.0, latency_rate=1.0, seed=1, reject_statuses=(429,)):
+        HTTPServer.__init__(self, ('127.0.0.1', port), FakeClusterHandler)
+        self.reject_rate = reject_rate
+        self.reject_statuses = reject_statuses
+        self.reject_request_rate = reject_request_rate
+        self.latency = latency
+        self.latency_rate = latency_rate
+        self.random = random.Random(seed)
+        self.documents = {}
+        self.scrolls = {}
+        self.scroll_ids = 0
+        self.requests = 0
+        self.rejected = 0
+        self.attempts = {}
+        self.rejections = {}
+        self.rejected_statuses = {}
+        self.connections = set()
+        self.stopped = False
+        self.lock = threading.Lock()
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+    def stop(self):
+        # keep-alive connections of the clients are closed too, their handler threads would
+        # otherwise keep serving them after the cluster is gone
+        self.stopped = True
+        self.shutdown()
+        self.server_close()
+        with self.lock:
+            connections = list(self.connections)
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+    def handle_error(self, request, client_address):
+        # connections cut by stop are expected
+        if not self.stopped:
+            HTTPServer.handle_error(self, request, client_address)
+    def roll(self, rate):
+        with self.lock:
+            return rate and self.random.random() < rate
+    def bulk(self, body):
+        lines = [line for line in body.split("\n") if line]
+        items = []
+        i = 0
+        while i < len(lines):
+            meta = json.loads(lines[i])
+            op_type = meta.keys()[0]
+            action = meta[op_type]
+            key = (action.get('_index'), action.get('_type'), action.get('_id'))
+            source = None
+            if op_type != 'delete':
+                i += 1
+                source = json.loads(lines[i])
+            i += 1
+            with self.lock:
+                self.attempts[key] = self.attempts.get(key, 0) + 1
+            if self.roll(self.reject_rate):
+                with self.lock:
+                    self.rejected += 1
+                    self.rejections[key] = self.rejections.get(key, 0) + 1
+                    status = self.random.choice(self.reject_statuses)
+                    self.rejected_statuses[status] = self.rejected_statuses.get(status, 0) + 1
+                items.append({op_type: {'_index': key[0], '_type': key[1], '_id': key[2], 'status': status, 'error': 'EsRejectedExecutionException'}})
+                continue
+            with self.lock:
+                if op_type == 'delete':
+                    status = 200 if self.documents.pop(key, None) is not None else 404
+                elif op_type == 'update':
+                    document = self.documents.setdefault(key, {})
+                    document.update(source.get('doc', {}))
+                    status = 200
+                else:
+                    status = 200 if key in self.documents else 201
+                    self.documents[key] = source
+            items.append({op_type: {'_index': key[0], '_type': key[1], '_id': key[2], 'status': status}})
+        return {'took': 1, 'errors': any([item.values()[0]['status'] >= 300 for item in items]), 'items': items}
+    def search(self, index, doc_type, params, body=None):
+        body = body or {}
+        with self.lock:
+            hits = [{'_index': key[0], '_type': key[1], '_id': key[2], '_score': 1.0, '_source': source,
+                     'sort': [source.get('_rank'), "%s#%s" % (key[1], key[2])]}
+                    for key, source in self.documents.items() if key[0] == index and (not doc_type or key[1] == doc_type)]
+        reverse = params.get('sort', '_rank:desc').endswith(':desc')
+        for sort in body.get('sort', [])[:1]:
+            field, order = sort.items()[0]
+            reverse = (order.get('order', 'asc') if isinstance(order, dict) else order) == 'desc'
+        hits.sort(key=lambda hit: hit['sort'], reverse=reverse)
+        total = len(hits)
+        start = int(body.get('from', params.get('from', 0)))
+        size = int(body.get('size', params.get('size', 10)))
+        response = {'took': 1, 'timed_out': False, 'hits': {'total': total, 'max_score': 1.0, 'hits': hits[start:start+size]}}
+        if 'scroll' in params:
+            with self.lock:
+                self.scroll_ids += 1
+                scroll_id = "scroll%d" % self.scroll_ids
+                self.scrolls[scroll_id] = (hits[start+size:], size)
+            response['_scroll_id'] = scroll_id
+        return response
+    def scroll(self, scroll_id, clear=False):
+        with self.lock:
+            hits, size = self.scrolls.pop(scroll_id, ([], 0))
+            if not clear and hits:
+                self.scrolls[scroll_id] = (hits[size:], size)
+        if clear:
+            return {'succeeded': True}
+        return {'_scroll_id': scroll_id, 'took': 1, 'timed_out': False, 'hits': {'total': len(hits), 'hits': hits[:size]}}
+    def msearch(self, body):
+        lines = [json.loads(line) for line in body.split("\n") if line]
+        responses = []
+        for header, search in zip(lines[::2], lines[1::2]):
+            responses.append(self.search(header.get('index'), header.get('type'), {}, search))
+        return {'responses': responses}
+    def mget(self, index, doc_type, body, params):
+        include = params.get('_source_include')
+        docs = []
+        for doc_id in json.loads(body)['ids']:
+            status, document = self.get(index, doc_type, doc_id)
+            if include and document['found']:
+                document['_source'] = dict([(key, value) for key, value in document['_source'].items() if key in include.split(',')])
+            docs.append(document)
+        return {'docs': docs}
+    def get(self, index, doc_type, doc_id):
+        with self.lock:
+            source = self.documents.get((index, doc_type, doc_id))
+        if source is None:
+            return 404, {'_index': index, '_type': doc_type, '_id': doc_id, 'found': False}
+        return 200, {'_index': index, '_type': doc_type, '_id': doc_id, 'found': True, '_source': source}
+
+class FakeClusterHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body go out in separate writes, with nagle the client waits on a delayed ack
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections.add(self.connection)
+    def finish(self):
+        with self.server.lock:
+            self.server.connections.discard(self.connection)
+        try:
+            BaseHTTPRequestHandler.finish(self)
+        except socket.error:
+            pass
+    def respond(self, status, body):
+        data = json.dumps(body)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(data)
+    def handle_any(self):
+        cluster = self.server
+        with cluster.lock:
+            cluster.requests += 1
+        if cluster.latency and cluster.roll(cluster.latency_rate):
+            time.sleep(cluster.latency)
+        url = urlparse.urlparse(self.path)
+        params = dict(urlparse.parse_qsl(url.query))
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else ""
+        if cluster.roll(cluster.reject_request_rate):
+            with cluster.lock:
+                cluster.rejected += 1
+            return self.respond(429, {'error': 'EsRejectedExecutionException', 'status': 429})
+        parts = [part for part in url.path.split('/') if part]
+        if parts and parts[-1] == '_bulk':
+            return self.respond(200, cluster.bulk(body))
+        if parts and parts[-1] == '_msearch':
+            return self.respond(200, cluster.msearch(body))
+        if len(parts) == 3 and parts[-1] == '_mget':
+            return self.respond(200, cluster.mget(parts[0], parts[1], body, params))
+        if parts[:2] == ['_search', 'scroll']:
+            scroll_id = parts[2] if len(parts) > 2 else params.get('scroll_id') or body
+            if body.startswith('{'):
+                scroll_id = json.loads(body).get('scroll_id')
+            return self.respond(200, cluster.scroll(scroll_id, clear=self.command == 'DELETE'))
+        if parts and parts[-1] == '_search':
+            search = json.loads(body) if body else None
+            return self.respond(200, cluster.search(parts[0], parts[1] if len(parts) > 2 else None, params, search))
+        if len(parts) == 3:
+            return self.respond(*cluster.get(*parts))
+        if not parts:
+            return self.respond(200, {'status': 200, 'version': {'number': '1.7.0'}})
+        return self.respond(400, {'error': 'unsupported request %s' % url.path, 'status': 400})
+    do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = handle_any
@@ -0,0 +1,118 @@
+#
+#       (C) 2013 Varun Mittal <varunmittal91@gmail.com>
+#       JARVIS program is distributed under the terms of the GNU General Public License v3
+#
+#       This file is part of JARVIS.
+#
+#       JARVIS is free software: you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation version 3 of the License.
+#
+#       JARVIS is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with JARVIS.  If not, see <http://www.gnu.org/licenses/>.
+#
+# usage: python -m benchmarks.run [-o results.json] [-c baseline.json] [-t 0.2] [benchmark ...]
+# runs the benchmarks offline and writes their results as json. with a baseline from an earlier
+# run, every number that got worse by more than the tolerance is listed.
+
+import sys
+import time
+import json
+import platform
+import optparse
+import importlib
+import subprocess
+
+benchmarks = ['tokenize', 'payload', 'bulk', 'query', 'hydration', 'retry', 'hedging', 'metrics', 'nhpcdb', 'codecs']
+
+# direction of a number by the last part of its name, times, sizes and request counts are better
+# lower and anything else is assumed to be one of them. the sizes of the workloads are not compared.
+higher_is_better = ('per_second', 'indexed', 'stored')
+not_compared = ('documents', 'models', 'legacy_tokens', 'raw_bytes', 'legacy_bytes')
+
+def getRevision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.STDOUT).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def runAll(names):
+    results = {}
+    for name in names:
+        module = importlib.import_module('benchmarks.bench_%s' % name)
+        sys.stderr.write("running %s\n" % name)
+        results[name] = module.run()
+    return {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'revision': getRevision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+        },
+        'results': results,
+    }
+
+def flatten(results, prefix=""):
+    values = {}
+    for key, value in results.items():
+        name = "%s.%s" % (prefix, key) if prefix else key
+        if isinstance(value, dict):
+            values.update(flatten(value, name))
+        elif isinstance(value, (int, long, float)) and not isinstance(value, bool):
+            values[name] = value
+    return values
+
+def getDirection(name):
+    # 1 when higher is better, -1 when lower is, 0 when the number is not compared
+    leaf = name.split('.')[-1]
+    if leaf in not_compared:
+        return 0
+    if [suffix for suffix in higher_is_better if leaf.endswith(suffix)]:
+        return 1
+    return -1
+
+def compare(results, baseline, tolerance):
+    # regressions only, as (name, before, after, relative change)
+    current = flatten(results['results'])
+    previous = flatten(baseline['results'])
+    changes = []
+    for name in sorted(set(current) & set(previous)):
+        if not previous[name]:
+            continue
+        change = (current[name] - previous[name]) / float(previous[name])
+        if change * getDirection(name) < -tolerance:
+            changes.append((name, previous[name], current[name], change))
+    return changes
+
+def main(argv=None):
+    parser = optparse.OptionParser(usage="%prog [options] [benchmark ...]")
+    parser.add_option('-o', '--output', help="write results to this file instead of stdout")
+    parser.add_option('-c', '--compare', help="results of an earlier run to compare against")
+    parser.add_option('-t', '--tolerance', type='float', default=0.2, help="relative regression reported by --compare")
+    options, names = parser.parse_args(argv)
+    for name in names:
+        if name not in benchmarks:
+            parser.error("unknown benchmark %s, one of: %s" % (name, ", ".join(benchmarks)))
+    results = runAll(names or benchmarks)
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if options.output:
+        with open(options.output, 'w') as f:
+            f.write(output)
+    else:
+        print output
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)
+        changes = compare(results, baseline, options.tolerance)
+        for name, before, after, change in changes:
+            sys.stderr.write("%-50s %12.6g -> %12.6g %+6.1f%%\n" % (name, before, after, change * 100))
+        return 1 if changes else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -18,7 +18,14 @@
 #
 
 from .scored_document import EsSearchDocument, EsStringField, EsTextField, stop_words
+from .tokenizer import EsTokenizer
 from .index import EsIndex, EsQueryObject
+from .index_group import EsIndexGroup
+from .mapping import EsAnalyzer, EsMapping
+from .async_index import AsyncEsIndex
+from .futures import wait_all
+from .cache import EsQueryCache, LocalCacheBackend, DjangoCacheBackend
+from .metrics import setSink, MemorySink, StatsdSink, LoggingSink
 
 from django.conf import settings
 LOAD_NHPCDB = getattr(settings, 'LOAD_NHPCDB', None)
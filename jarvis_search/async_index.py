@@ -0,0 +1,89 @@
+#
+#       (C) 2013 Varun Mittal <varunmittal91@gmail.com>
+#       JARVIS program is distributed under the terms of the GNU General Public License v3
+#
+#       This file is part of JARVIS.
+#
+#       JARVIS is free software: you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation version 3 of the License.
+#
+#       JARVIS is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with JARVIS.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import base64
+import urllib
+import simplejson as json
+
+from django.conf import settings
+
+from .index import EsIndex, EsResultObject, buildDocument, getSearchBody, es_client_conn, is_appengine_environment
+from .futures import EsFuture, submit
+
+if is_appengine_environment:
+    from google.appengine.api import urlfetch
+
+class AsyncEsIndex:
+    # non blocking counterpart of EsIndex, every call returns an EsFuture and many can be in flight
+    # from one request handler. on app engine reads are urlfetch rpcs multiplexed by the runtime,
+    # elsewhere and for writes the blocking EsIndex call runs on a shared thread pool.
+    def __init__(self, name, concurrency=None, retry_policy=None, pool_size=None, cache=None, lazy_results=None):
+        self.index = EsIndex(name, concurrency=concurrency, retry_policy=retry_policy, cache=cache, lazy_results=lazy_results)
+        self.pool_size = pool_size or getattr(settings, 'ES_ASYNC_POOL_SIZE', 10)
+    def get(self, search_doc_id, doc_type):
+        if not is_appengine_environment:
+            return submit('async', self.pool_size, self.index.get, search_doc_id, doc_type)
+        path = "%s/%s/%s" % (self.index.getName(), urllib.quote(doc_type), urllib.quote(str(search_doc_id)))
+        def callback(response):
+            if response.status_code == 404:
+                return None
+            if response.status_code != 200:
+                return self.index.get(search_doc_id, doc_type)
+            document = json.loads(response.content)
+            if not document.get('found'):
+                return None
+            return buildDocument(document['_source'], doc_type, search_doc_id)
+        return EsFuture(self.__fetch(path), callback)
+    def get_multi(self, search_doc_ids, doc_type, fields=None):
+        return submit('async', self.pool_size, self.index.get_multi, search_doc_ids, doc_type, fields)
+    def query(self, query_object):
+        if not is_appengine_environment or self.index.cache:
+            return submit('async', self.pool_size, self.index.query, query_object)
+        config, match_only, reverse = self.index.getSearchConfig(query_object)
+        # urlfetch reads with GET, the body goes in the source parameter
+        params = {'source': json.dumps(getSearchBody(config))}
+        path = "%s/%s/_search" % (config['index'], urllib.quote(config['doc_type']))
+        def callback(response):
+            # failed rpcs fall back to the blocking path, which retries
+            if response.status_code != 200:
+                return self.index.query(query_object)
+            return EsResultObject(json.loads(response.content), match_only=match_only, reverse=reverse, lazy=self.index.lazy_results)
+        return EsFuture(self.__fetch(path, params), callback)
+    def query_multi(self, query_objects):
+        return submit('async', self.pool_size, self.index.query_multi, query_objects)
+    def put(self, documents):
+        return submit('async', self.pool_size, self.index.put, documents)
+    def update(self, doc, update_fields, doc_type):
+        return submit('async', self.pool_size, self.index.update, doc, update_fields, doc_type)
+    def delete(self, search_doc_ids, doc_type):
+        return submit('async', self.pool_size, self.index.delete, search_doc_ids, doc_type)
+    def query_filtered(self, query_object):
+        return submit('async', self.pool_size, self.index.query_filtered, query_object)
+    def __fetch(self, path, params=None):
+        server = es_client_conn.hosts.choose().server
+        url = "%s%s" % (server['url'], path)
+        if params:
+            params = dict([(key, value.encode('utf-8') if isinstance(value, unicode) else value) for key, value in params.items()])
+            url = "%s?%s" % (url, urllib.urlencode(params))
+        headers = {}
+        if server.get('http_auth'):
+            headers['Authorization'] = "Basic %s" % base64.b64encode(server['http_auth'])
+        rpc = urlfetch.create_rpc(deadline=60)
+        urlfetch.make_fetch_call(rpc, url, headers=headers)
+        return rpc
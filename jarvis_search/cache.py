@@ -0,0 +1,149 @@
+#
+#       (C) 2013 Varun Mittal <varunmittal91@gmail.com>
+#       JARVIS program is distributed under the terms of the GNU General Public License v3
+#
+#       This file is part of JARVIS.
+#
+#       JARVIS is free software: you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation version 3 of the License.
+#
+#       JARVIS is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with JARVIS.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import time
+import hashlib
+from threading import Lock, Timer
+from collections import OrderedDict
+
+from django.conf import settings
+
+from . import metrics
+
+class LocalCacheBackend:
+    # in-process lru, bounded by entry count and by the number of cached documents
+    def __init__(self, max_entries=1000, max_documents=100000):
+        self.max_entries = max_entries
+        self.max_documents = max_documents
+        self.__entries = OrderedDict()
+        self.__counters = {}
+        self.__documents = 0
+        self.__lock = Lock()
+    def get(self, key):
+        with self.__lock:
+            try:
+                value, expires, size = self.__entries.pop(key)
+            except KeyError:
+                return None
+            if expires and expires < time.time():
+                self.__documents -= size
+                return None
+            self.__entries[key] = (value, expires, size)
+            return value
+    def set(self, key, value, ttl=None):
+        size = len(getattr(value, 'documents', ()))
+        expires = time.time() + ttl if ttl else None
+        with self.__lock:
+            try:
+                self.__documents -= self.__entries.pop(key)[2]
+            except KeyError:
+                pass
+            self.__entries[key] = (value, expires, size)
+            self.__documents += size
+            while self.__entries and (len(self.__entries) > self.max_entries or self.__documents > self.max_documents):
+                self.__documents -= self.__entries.popitem(last=False)[1][2]
+    def getCounter(self, key):
+        return self.__counters.get(key, 0)
+    def incr(self, key):
+        with self.__lock:
+            self.__counters[key] = self.__counters.get(key, 0) + 1
+            return self.__counters[key]
+
+class DjangoCacheBackend:
+    # any configured django cache, memcached or a local file cache shared by the processes of a host
+    def __init__(self, alias='default'):
+        try:
+            from django.core.cache import caches
+            self.cache = caches[alias]
+        except ImportError:
+            from django.core.cache import get_cache
+            self.cache = get_cache(alias)
+    def get(self, key):
+        return self.cache.get(key)
+    def set(self, key, value, ttl=None):
+        self.cache.set(key, value, ttl)
+    def getCounter(self, key):
+        # evicted counters restart from the clock so that they never return to an old value
+        value = self.cache.get(key)
+        if value is None:
+            self.cache.add(key, int(time.time() * 1000), None)
+            value = self.cache.get(key)
+        return value
+    def incr(self, key):
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            self.getCounter(key)
+            return self.cache.incr(key)
+
+class EsQueryCache:
+    # results are keyed on the index, its write generation and the normalized query, writes to an
+    # index bump its generation so stale entries are never read again and age out of the backend.
+    # writes only show in searches after the next refresh of the index, a query in between would
+    # cache what it read before the write under the new generation, so the generation is bumped
+    # once more refresh_interval after the last write. generations live in the backend, writes are
+    # seen by the processes sharing it and a LocalCacheBackend only sees the writes of its process.
+    # cached EsResultObjects are shared between callers and should be treated as read only.
+    def __init__(self, backend=None, ttl=60, refresh_interval=None):
+        self.backend = backend or LocalCacheBackend()
+        self.ttl = ttl
+        self.refresh_interval = getattr(settings, 'ES_REFRESH_INTERVAL', 1.0) if refresh_interval is None else refresh_interval
+        self.hits = 0
+        self.misses = 0
+        self.__refreshes = {}
+        self.__lock = Lock()
+    def __generation(self, index_name):
+        return self.backend.getCounter("es_gen:%s" % index_name)
+    def getKey(self, index_name, query_key):
+        return "es_query:%s:%s:%s" % (index_name, self.__generation(index_name), hashlib.md5(query_key).hexdigest())
+    def get(self, key):
+        result = self.backend.get(key)
+        if result is None:
+            self.misses += 1
+            metrics.incr('es.cache.miss')
+        else:
+            self.hits += 1
+            metrics.incr('es.cache.hit')
+        return result
+    def set(self, key, result):
+        self.backend.set(key, result, self.ttl)
+    def invalidate(self, index_name):
+        self.backend.incr("es_gen:%s" % index_name)
+        if not self.refresh_interval:
+            return
+        # one timer per index, pushed back while writes keep coming
+        with self.__lock:
+            pending = index_name in self.__refreshes
+            self.__refreshes[index_name] = time.time() + self.refresh_interval
+        if not pending:
+            self.__schedule(index_name, self.refresh_interval)
+    def __schedule(self, index_name, delay):
+        timer = Timer(delay, self.__refreshed, (index_name,))
+        timer.daemon = True
+        timer.start()
+    def __refreshed(self, index_name):
+        with self.__lock:
+            delay = self.__refreshes[index_name] - time.time()
+            if delay <= 0:
+                del self.__refreshes[index_name]
+        if delay > 0:
+            return self.__schedule(index_name, delay)
+        self.backend.incr("es_gen:%s" % index_name)
+    def getStats(self):
+        return {'hits': self.hits, 'misses': self.misses}
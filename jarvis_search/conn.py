@@ -17,11 +17,18 @@
 #       along with JARVIS.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import os
+from threading import Lock
+
 from django.conf import settings
 
+import requests
+from requests.adapters import HTTPAdapter
 import elasticsearch
 from elasticsearch import Elasticsearch, RequestsHttpConnection
 
+from .hosts import HostSelector
+
 is_appengine_env = True
 try:
     from jarvis_frontend.utilities import isDevelopmentServer
@@ -29,8 +36,13 @@ except:
     is_appengine_env = False
 
 class ElasticSearchClient:
-    def __init__(self):
-        SERVERS = getattr(settings, 'ES_HOSTS', [])
+    max_connections_per_host = 10
+    timeout = 60
+
+    # nothing connects until es or session is first used, both are rebuilt when used from a process
+    # forked after they were created so that pre-fork workers never share sockets with their parent.
+    def __init__(self, servers=None):
+        SERVERS = servers or getattr(settings, 'ES_HOSTS', [])
         if is_appengine_env:
             if isDevelopmentServer():
                 __servers = []
@@ -39,11 +51,61 @@ class ElasticSearchClient:
                         continue
                     __servers.append(server)
                 SERVERS = __servers
-            for server in SERVERS:
-                if 'use_ssl' and server['use_ssl'] == True:
-                    url = "https://%s:%s/" % (server['host'], server['port'])
-                else:
-                    url = "http://%s:%s/" % (server['host'], server['port'])
-                server['url'] = url
+        for server in SERVERS:
+            if 'use_ssl' in server and server['use_ssl'] == True:
+                url = "https://%s:%s/" % (server['host'], server['port'])
+            else:
+                url = "http://%s:%s/" % (server['host'], server['port'])
+            server['url'] = url
         self.SERVERS = SERVERS
-        self.es = Elasticsearch(SERVERS)
+        self.max_connections_per_host = getattr(settings, 'ES_MAX_CONNECTIONS_PER_HOST', self.max_connections_per_host)
+        self.timeout = getattr(settings, 'ES_TIMEOUT', self.timeout)
+        self.hosts = HostSelector(SERVERS, **getattr(settings, 'ES_HOST_HEALTH_OPTIONS', {}))
+        self.__es = None
+        self.__session = None
+        self.__host_clients = {}
+        self.__pid = None
+        self.__lock = Lock()
+    def __checkPid(self):
+        if self.__pid != os.getpid():
+            self.__es = None
+            self.__session = None
+            self.__host_clients = {}
+            self.__pid = os.getpid()
+    def __getOptions(self):
+        options = {'maxsize': self.max_connections_per_host, 'timeout': self.timeout}
+        options.update(getattr(settings, 'ES_CONNECTION_OPTIONS', {}))
+        return options
+    @property
+    def es(self):
+        if self.__es is None or self.__pid != os.getpid():
+            with self.__lock:
+                self.__checkPid()
+                if self.__es is None:
+                    self.__es = Elasticsearch(self.SERVERS, **self.__getOptions())
+        return self.__es
+    def getHostClient(self, server):
+        # client bound to a single host, used when reads pick their host themselves
+        if len(self.SERVERS) < 2:
+            return self.es
+        key = server['url']
+        if key not in self.__host_clients or self.__pid != os.getpid():
+            with self.__lock:
+                self.__checkPid()
+                if key not in self.__host_clients:
+                    self.__host_clients[key] = Elasticsearch([server], **self.__getOptions())
+        return self.__host_clients[key]
+    @property
+    def session(self):
+        # keep-alive session for plain http calls, pooled like the elasticsearch transport
+        if self.__session is None or self.__pid != os.getpid():
+            with self.__lock:
+                self.__checkPid()
+                if self.__session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=max(len(self.SERVERS), 1),
+                            pool_maxsize=self.max_connections_per_host)
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    self.__session = session
+        return self.__session
@@ -0,0 +1,89 @@
+#
+#       (C) 2013 Varun Mittal <varunmittal91@gmail.com>
+#       JARVIS program is distributed under the terms of the GNU General Public License v3
+#
+#       This file is part of JARVIS.
+#
+#       JARVIS is free software: you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation version 3 of the License.
+#
+#       JARVIS is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with JARVIS.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+from threading import Lock
+from multiprocessing.pool import ThreadPool
+
+pools = {}
+pools_lock = Lock()
+pools_pid = [os.getpid()]
+
+def getPool(name, size):
+    # pools are shared per purpose and size, tasks of one pool may block on another but never on their own.
+    # worker threads do not survive a fork, a forked process starts over with its own pools.
+    key = (name, size)
+    if pools_pid[0] != os.getpid():
+        with pools_lock:
+            if pools_pid[0] != os.getpid():
+                pools.clear()
+                pools_pid[0] = os.getpid()
+    try:
+        return pools[key]
+    except KeyError:
+        with pools_lock:
+            if key not in pools:
+                pools[key] = ThreadPool(size)
+            return pools[key]
+
+class EsFuture:
+    # wraps an urlfetch rpc, a thread pool result or a cassandra driver ResponseFuture. callback
+    # transforms the raw result once, errback gets the exception and returns a result in its place
+    # or raises.
+    def __init__(self, source, callback=None, errback=None):
+        self.__source = source
+        self.__callback = callback
+        self.__errback = errback
+        self.__done = False
+        self.__result = None
+    def get_result(self):
+        if not self.__done:
+            try:
+                if hasattr(self.__source, 'get_result'):
+                    result = self.__source.get_result()
+                elif hasattr(self.__source, 'result'):
+                    result = self.__source.result()
+                else:
+                    result = self.__source.get()
+            except Exception as e:
+                if not self.__errback:
+                    raise
+                result = self.__errback(e)
+            else:
+                if self.__callback:
+                    result = self.__callback(result)
+            self.__result = result
+            self.__done = True
+        return self.__result
+    result = get_result
+    def ready(self):
+        if self.__done:
+            return True
+        if hasattr(self.__source, 'ready'):
+            return self.__source.ready()
+        return False
+    def then(self, callback):
+        # chains another transformation, nothing blocks until get_result is called
+        return EsFuture(self, callback=callback)
+
+def submit(name, size, func, *args, **kwargs):
+    return EsFuture(getPool(name, size).apply_async(func, args, kwargs))
+
+def wait_all(futures):
+    return [future.get_result() for future in futures]
@@ -0,0 +1,180 @@
+#
+#       (C) 2013 Varun Mittal <varunmittal91@gmail.com>
+#       JARVIS program is distributed under the terms of the GNU General Public License v3
+#
+#       This file is part of JARVIS.
+#
+#       JARVIS is free software: you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation version 3 of the License.
+#
+#       JARVIS is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with JARVIS.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import time
+import random
+from itertools import count
+from threading import Lock
+from Queue import Queue, Empty
+
+from .futures import getPool
+from . import metrics
+
+class EsHost:
+    # latency is an exponentially weighted moving average, failure_threshold failures in a row open
+    # the circuit for reset_timeout seconds after which a single trial request is let through.
+    # the score used to pick hosts halves every half_life seconds without a new sample, so a host
+    # that was slow once is tried again instead of being left out for good.
+    def __init__(self, server, alpha=0.3, failure_threshold=3, reset_timeout=30.0, half_life=10.0):
+        self.server = server
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_life = half_life
+        self.latency = 0.0
+        self.updated = 0
+        self.failures = 0
+        self.open_until = 0
+        self.__lock = Lock()
+    def record(self, latency):
+        with self.__lock:
+            if self.latency:
+                self.latency = self.alpha * latency + (1 - self.alpha) * self.latency
+            else:
+                self.latency = latency
+            self.updated = time.time()
+            self.failures = 0
+            self.open_until = 0
+    def recordFailure(self):
+        with self.__lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.open_until = time.time() + self.reset_timeout
+    def score(self, now):
+        if not self.latency:
+            return 0.0
+        return self.latency * 0.5 ** ((now - self.updated) / self.half_life)
+    def available(self, now):
+        if self.open_until <= now:
+            return True
+        return False
+    def trial(self, now):
+        # half open, the next request probes the host and pushes the circuit out again meanwhile
+        with self.__lock:
+            if self.open_until and self.open_until <= now:
+                self.open_until = now + self.reset_timeout
+                return True
+            return not self.open_until
+
+class HostSelector:
+    hedge_pool_size = 20
+    max_hedges = 5
+
+    # with round_robin, healthy hosts take turns instead of the fastest one taking every request
+    def __init__(self, servers, round_robin=False, **options):
+        self.hosts = [EsHost(server, **options) for server in servers]
+        self.round_robin = round_robin
+        self.__turn = count()
+        self.__in_flight = 0
+        self.__hedges = 0
+        self.__lock = Lock()
+    def choose(self, exclude=()):
+        now = time.time()
+        hosts = [host for host in self.hosts if host not in exclude]
+        if not hosts:
+            return None
+        available = [host for host in hosts if host.available(now)]
+        if not available:
+            # every circuit is open, try the host closest to closing it
+            return min(hosts, key=lambda host: host.open_until)
+        if self.round_robin:
+            turn = next(self.__turn) % len(available)
+            ordered = available[turn:] + available[:turn]
+        else:
+            # power of two choices, the better scored of two random hosts goes first
+            candidates = random.sample(available, 2) if len(available) > 2 else available
+            ordered = sorted(candidates, key=lambda host: host.score(now))
+            ordered += [host for host in available if host not in candidates]
+        for host in ordered:
+            if host.trial(now):
+                return host
+        return available[0]
+    def call(self, func, hedge_delay=None):
+        # runs func(host) on the best healthy host. with hedge_delay, once that many seconds pass
+        # without an answer (or on an early failure) the call is repeated on the next best host and
+        # whichever succeeds first wins, the slower request is left to finish in the background.
+        # requests left behind hold pool threads, so at most max_hedges hedges are in flight and
+        # when the pool is taken the call runs unhedged on the caller's thread instead of queueing.
+        primary = self.choose()
+        if not hedge_delay or len(self.hosts) < 2 or not self.__reserve():
+            return self.__run(primary, func)
+        results = Queue()
+        pool = getPool('hedge', self.hedge_pool_size)
+        def run(host, hedge):
+            try:
+                results.put((True, self.__run(host, func)))
+            except Exception as e:
+                results.put((False, e))
+            finally:
+                self.__release(hedge)
+        pool.apply_async(run, (primary, False))
+        launched = 1
+        answered = 0
+        hedged = False
+        error = None
+        try:
+            answer = results.get(timeout=hedge_delay)
+        except Empty:
+            answer = None
+        while True:
+            if answer is not None:
+                answered += 1
+                ok, value = answer
+                if ok:
+                    return value
+                error = value
+            if not hedged:
+                hedged = True
+                secondary = self.choose(exclude=[primary])
+                if secondary and self.__reserve(hedge=True):
+                    pool.apply_async(run, (secondary, True))
+                    launched += 1
+                    metrics.incr('es.hedge')
+            if answered == launched:
+                raise error
+            answer = results.get()
+    def __reserve(self, hedge=False):
+        with self.__lock:
+            # max_hedges threads are kept for hedges, primaries can not starve them
+            if hedge and self.__hedges >= self.max_hedges:
+                return False
+            if not hedge and self.__in_flight - self.__hedges >= self.hedge_pool_size - self.max_hedges:
+                return False
+            self.__in_flight += 1
+            if hedge:
+                self.__hedges += 1
+            return True
+    def __release(self, hedge):
+        with self.__lock:
+            self.__in_flight -= 1
+            if hedge:
+                self.__hedges -= 1
+    def __run(self, host, func):
+        start = time.time()
+        try:
+            result = func(host)
+        except Exception as e:
+            # client errors say nothing about the health of the host
+            status = getattr(e, 'status_code', None)
+            if host and not (isinstance(status, int) and 400 <= status < 500 and status != 429):
+                host.recordFailure()
+            raise
+        if host:
+            host.record(time.time() - start)
+        return result
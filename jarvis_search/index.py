@@ -17,12 +17,11 @@
 #       along with JARVIS.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-import sys
 import base64
 import simplejson as json
-import requests
 from requests.auth import HTTPBasicAuth
 from copy import deepcopy
+from collections import deque, OrderedDict
 is_appengine_environment = False
 
 try:
@@ -32,30 +31,112 @@ try:
 except ImportError:
     pass
 
+from django.conf import settings
+
 from elasticsearch import helpers
 from elasticsearch.exceptions import TransportError
 
 from .exceptions import IndexException
 from .conn import ElasticSearchClient
-from .scored_document import EsSearchDocument, EsFieldBase
+from .scored_document import EsSearchDocument, EsResultDocument, EsFieldBase
+from .mapping import getIndexBody, words_field
+from .retry import default_retry_policy
+from .futures import getPool
+from . import metrics
 es_client_conn = ElasticSearchClient()
 
 class EsIndex:
     transaction_header_size = 100
     max_transaction_size = 10000000 - transaction_header_size
+    max_mget_ids = 1000
 
-    def __init__(self, name):
+    def __init__(self, name, concurrency=None, retry_policy=None, cache=None, lazy_results=None, hedge_delay=None):
         self.__name = name.lower()
+        # number of bulk requests kept in flight by put, put_stream and delete
+        self.concurrency = concurrency or getattr(settings, 'ES_BULK_CONCURRENCY', 1)
+        self.retry_policy = retry_policy or default_retry_policy
+        # opt-in EsQueryCache for query results, invalidated by writes made through this class. writes
+        # from other processes are only seen when they share the cache backend
+        self.cache = cache
+        if lazy_results is None:
+            lazy_results = getattr(settings, 'ES_LAZY_RESULTS', False)
+        self.lazy_results = lazy_results
+        # seconds after which a read is duplicated to a second host, 0 disables hedging and None
+        # falls back to ES_HEDGE_DELAY
+        self.hedge_delay = getattr(settings, 'ES_HEDGE_DELAY', None) if hedge_delay is None else hedge_delay
+    def getName(self):
+        return self.__name
+    def exists(self):
+        return es_client_conn.es.indices.exists(index=self.__name)
+    def create(self, mappings=[], name=None, **settings):
+        body = getIndexBody(mappings, **settings)
+        return es_client_conn.es.indices.create(index=name or self.__name, body=body)
+    def putMapping(self, mapping):
+        return es_client_conn.es.indices.put_mapping(index=self.__name, doc_type=mapping.doc_type, body=mapping.getMapping())
+    def migrate(self, mappings, new_name, transform=None, delete_old=False, **settings):
+        # copies documents into a new index created with mappings, _source is copied as it is
+        # unless a transform(doc_type, source) is given, mapping.collapseNgramFields shrinks fields
+        # expanded on the client back to raw text at the cost of words it can not tell from grams.
+        # the old name is then pointed to the new index through an alias. an alias can not share
+        # its name with an index, when the old name is still an index it is only replaced with
+        # delete_old.
+        es = es_client_conn.es
+        new_name = new_name.lower()
+        aliased = es.indices.exists_alias(name=self.__name)
+        if not aliased and not delete_old:
+            raise IndexException("%s is an index and not an alias, pass delete_old=True to replace it with an alias to %s" % (self.__name, new_name))
+        self.create(mappings, name=new_name, **settings)
+        def actions():
+            for hit in helpers.scan(es, index=self.__name, scroll='5m'):
+                source = hit['_source']
+                if transform:
+                    source = transform(hit['_type'], source)
+                yield {
+                    "_index": new_name,
+                    "_type": hit['_type'],
+                    "_id": hit['_id'],
+                    "_source": source,
+                }
+        results = helpers.bulk(client=es, actions=actions())
+        self.__invalidate()
+        if aliased:
+            old_indices = es.indices.get_alias(name=self.__name).keys()
+            alias_actions = [{'remove': {'index': index, 'alias': self.__name}} for index in old_indices]
+            alias_actions.append({'add': {'index': new_name, 'alias': self.__name}})
+            es.indices.update_aliases(body={'actions': alias_actions})
+            if delete_old:
+                for index in old_indices:
+                    es.indices.delete(index=index)
+        else:
+            es.indices.delete(index=self.__name)
+            es.indices.put_alias(index=new_name, name=self.__name)
+        return results
+    @metrics.timed('es.get')
     def get(self, search_doc_id, doc_type):
-        document = es_client_conn.es.get(doc_type=doc_type, id=search_doc_id, index=self.__name, ignore=[400, 404])
+        document = self.readCall('get', doc_type=doc_type, id=search_doc_id, index=self.__name, ignore=[400, 404])
         if 'found' not in document or not document['found']:
             return None
-        document = document['_source']
-        fields = []
-        for name, value in zip(document.keys(), document.values()):
-            fields.append(EsFieldBase(name=name, value=value))
-        doc = EsSearchDocument(rank=document['_rank'], doc_type=doc_type, fields=fields, id=search_doc_id)
-        return doc
+        return buildDocument(document['_source'], doc_type, search_doc_id)
+    @metrics.timed('es.get_multi')
+    def get_multi(self, search_doc_ids, doc_type, fields=None):
+        # documents come back in the order of search_doc_ids, None for the ones not found.
+        # fields restricts the _source returned, long id lists are fetched max_mget_ids at a time.
+        # a missing index finds nothing, as with get.
+        chunk_size = getattr(settings, 'ES_MGET_CHUNK_SIZE', self.max_mget_ids)
+        params = {}
+        if fields:
+            params['_source_include'] = ",".join(set(fields) | set(['_rank']))
+        documents = {}
+        unique_ids = list(OrderedDict.fromkeys(search_doc_ids))
+        for i in xrange(0, len(unique_ids), chunk_size):
+            chunk = unique_ids[i:i+chunk_size]
+            response = self.readCall('mget', body={'ids': chunk}, index=self.__name, doc_type=doc_type, ignore=[404], **params)
+            if 'docs' not in response:
+                break
+            for doc_id, document in zip(chunk, response['docs']):
+                if document.get('found'):
+                    documents[doc_id] = buildDocument(document['_source'], doc_type, doc_id)
+        return [documents.get(doc_id) for doc_id in search_doc_ids]
     def update(self, doc, update_fields, doc_type):
         actions = [{
             "_op_type": 'update',
@@ -67,35 +148,46 @@ class EsIndex:
         }]
         for field in update_fields:
             actions[0]['doc'][field.name] = field.value
-        results = helpers.bulk(client=es_client_conn.es, actions=actions,)
-        del actions
-        return results[0]
+        return len(self.__put__(actions))
+    @metrics.timed('es.put')
     def put(self, documents):
-        __documents = []
-        results = []
-        if type(documents) == list:
-            for document in documents:
-                __documents.append(document.getDoc(self.__name))
-        else:
-            __documents.append(documents.getDoc(self.__name))
-        actions = EsActions()
-        for document in __documents:
-            action = {
-                "_index": document['index'],
-                "_type": document['doc_type'],
-                "_id": document['id'],
-                "_source": document['body'],
-            }
-            actions.addAction(action)
+        if type(documents) != list:
+            documents = [documents]
+        actions = EsActions(concurrency=self.concurrency, retry_policy=self.retry_policy)
+        for document in documents:
+            actions.addAction(self.__getPutAction(document))
         actions.push()
-        results = actions.push()
+        self.__invalidate()
+        results = actions.getResults()
         del actions
         return results
+    def put_stream(self, documents, max_actions=None, max_bytes=None):
+        # consumes documents lazily, yields (ok, item) for every document as its batch completes
+        actions = EsActions(max_actions=max_actions, max_bytes=max_bytes, collect=False, concurrency=self.concurrency, retry_policy=self.retry_policy)
+        for document in documents:
+            results = actions.addAction(self.__getPutAction(document))
+            if results:
+                self.__invalidate()
+                for result in results:
+                    yield result
+        results = actions.push()
+        self.__invalidate()
+        for result in results:
+            yield result
+    def __getPutAction(self, document):
+        document = document.getDoc(self.__name)
+        return {
+            "_index": document['index'],
+            "_type": document['doc_type'],
+            "_id": document['id'],
+            "_source": document['body'],
+        }
+    @metrics.timed('es.delete')
     def delete(self, search_doc_ids, doc_type):
         actions = []
         if type(search_doc_ids) != list:
             search_doc_ids = [search_doc_ids]
-        actions = EsActions()
+        actions = EsActions(concurrency=self.concurrency, retry_policy=self.retry_policy)
         for doc_id in search_doc_ids:
             actions.addAction({
                 "_op_type": 'delete',
@@ -104,29 +196,111 @@ class EsIndex:
                 "_id": doc_id,
             })
         actions.push()
+        self.__invalidate()
         results = actions.getResults()
         del actions
         return results
     def __put__(self, actions):
-        results = [action['_id'] for action in actions]
-        if is_appengine_environment:
-            retry_count = 0
-            while retry_count < 5:
-                try:
-                    __results = helpers.bulk(client=es_client_conn.es, actions=actions,)
-                    break
-                except DeadlineExceededError:
-                    retry_count += 1
-            if retry_count == 5:
-                raise DeadlineExceededError
-        else:
-            __results = helpers.bulk(client=es_client_conn.es, actions=actions,)
-        for result in __results[1]:
-            if result['index']['status'] != 200:
-                raise IndexException(result['index']['error'])
-            results.append(result['index']['_id'])
+        bulk = EsActions(concurrency=self.concurrency, retry_policy=self.retry_policy)
+        for action in actions:
+            bulk.addAction(action)
+        bulk.push()
+        self.__invalidate()
+        results = bulk.getResults()
+        del bulk
         return results
+    @metrics.timed('es.query')
     def query(self, query_object):
+        if self.cache:
+            key = self.cache.getKey(self.__name, query_object.getCacheKey())
+            result = self.cache.get(key)
+            if result is not None:
+                return result
+        config, match_only, reverse = self.getSearchConfig(query_object)
+        try:
+            response = self.readCall('search', index=config['index'], doc_type=config['doc_type'], body=getSearchBody(config))
+        except TransportError:
+            return EsResultObject()
+        result = EsResultObject(response, match_only=match_only, reverse=reverse, lazy=self.lazy_results)
+        if self.cache:
+            self.cache.set(key, result)
+        return result
+    @metrics.timed('es.query_multi')
+    def query_multi(self, query_objects):
+        # one _msearch round trip for all queries, results come back in the same order. queries
+        # rejected with a retryable status are resent on their own, other failures are reported
+        # through the error attribute of their EsResultObject.
+        results = [None] * len(query_objects)
+        keys = [None] * len(query_objects)
+        configs = {}
+        for i, query_object in enumerate(query_objects):
+            if self.cache:
+                keys[i] = self.cache.getKey(self.__name, query_object.getCacheKey())
+                results[i] = self.cache.get(keys[i])
+                if results[i] is not None:
+                    continue
+            configs[i] = self.getSearchConfig(query_object)
+        pending = sorted(configs.keys())
+        attempt = 0
+        while pending:
+            body = []
+            for i in pending:
+                body.extend(getMultiSearchLines(configs[i][0]))
+            try:
+                responses = self.readCall('msearch', body=body)['responses']
+            except TransportError as e:
+                for i in pending:
+                    results[i] = EsResultObject(error=str(e))
+                break
+            retry = []
+            for i, response in zip(pending, responses):
+                config, match_only, reverse = configs[i]
+                if 'error' not in response:
+                    results[i] = EsResultObject(response, match_only=match_only, reverse=reverse, lazy=self.lazy_results)
+                    if self.cache:
+                        self.cache.set(keys[i], results[i])
+                    continue
+                results[i] = EsResultObject(error=response['error'])
+                if self.retry_policy.isRetryableStatus(getErrorStatus(response)):
+                    retry.append(i)
+            if not retry or not self.retry_policy.wait(attempt):
+                break
+            pending = retry
+            attempt += 1
+        return results
+    def iter_query(self, query_object, page_size=None, scroll='1m'):
+        # streams every match of query_object page by page, ignoring its offset and limit, through a
+        # scroll context kept alive for scroll ("1m") between pages. the scroll is cleared once
+        # iteration stops, so at most one page is held on either side.
+        config, match_only, reverse = self.getSearchConfig(query_object)
+        body = getSearchBody(config)
+        del body['from']
+        body['size'] = page_size or config['size']
+        if match_only:
+            body['sort'] = [{'_score': {'order': 'desc'}}]
+        es = es_client_conn.es
+        response = self.retry_policy.call(es.search, index=config['index'], doc_type=config['doc_type'], body=body, scroll=scroll)
+        scroll_id = response.get('_scroll_id')
+        try:
+            while response['hits']['hits']:
+                for hit in response['hits']['hits']:
+                    yield self.__wrapHit(hit)
+                response = self.retry_policy.call(es.scroll, scroll_id=scroll_id, scroll=scroll)
+                scroll_id = response.get('_scroll_id', scroll_id)
+        finally:
+            if scroll_id:
+                try:
+                    es.clear_scroll(scroll_id=scroll_id)
+                except TransportError:
+                    pass
+    def __wrapHit(self, hit):
+        if self.lazy_results:
+            return EsResultDocument(hit['_source'], hit['_type'], hit['_id'])
+        return buildDocument(hit['_source'], hit['_type'], hit['_id'])
+    def __invalidate(self):
+        if self.cache:
+            self.cache.invalidate(self.__name)
+    def getSearchConfig(self, query_object):
         config = query_object.getSearchObject()
 
         _source = config.get('_source', "")
@@ -148,69 +322,170 @@ class EsIndex:
                 config['sort']  = "_rank:desc"
         reverse = config['reverse']
         del config['reverse']
-        try:
-            if is_appengine_environment:
-                retry_count = 0
-                while retry_count < 2:
-                    try:
-                        response = es_client_conn.es.search(**config)
-                        break
-                    except DeadlineExceededError:
-                        retry_count += 1
-                if retry_count == 2:
-                    raise DeadlineExceededError
-            else:
-                response = es_client_conn.es.search(**config)
-        except TransportError:
-            return EsResultObject()
-        return EsResultObject(response, match_only=match_only, reverse=reverse)
+        return config, match_only, reverse
     def query_filtered(self, query_object):
-        server = es_client_conn.SERVERS[0]
-        credentials = server['http_auth'].split(':')
         payload = {'q': query_object.getQueryString(), 'm': query_object.getOffset(), 's': query_object.getLimit()}
-        r = requests.get("%s/search/" % server['url'], auth=HTTPBasicAuth(credentials[0], credentials[1]), params=payload, timeout=60)
+        def fetch(host):
+            server = host.server
+            credentials = server['http_auth'].split(':')
+            r = es_client_conn.session.get("%ssearch/" % server['url'], auth=HTTPBasicAuth(credentials[0], credentials[1]), params=payload, timeout=es_client_conn.timeout)
+            if r.status_code >= 500:
+                r.raise_for_status()
+            return r
+        r = es_client_conn.hosts.call(fetch, hedge_delay=self.hedge_delay)
         if r.status_code == 200:
             return r.content
         return
+    def readCall(self, method, **kwargs):
+        # reads go to the host with the lowest latency and a closed circuit, optionally hedged
+        def call(host):
+            return getattr(es_client_conn.getHostClient(host and host.server), method)(**kwargs)
+        return self.retry_policy.call(es_client_conn.hosts.call, call, hedge_delay=self.hedge_delay)
 
 class EsActions:
     transaction_header_size = 100
     max_transaction_size = 10000000 - transaction_header_size
+    max_transaction_actions = 200
 
-    def __init__(self):
+    # batches are flushed before they grow past max_bytes of serialized ndjson or max_actions actions.
+    # with collect, ids of indexed documents are kept for getResults and failed items raise IndexException,
+    # otherwise addAction and push return the (ok, item) results of the flushed batches.
+    # with concurrency > 1 up to that many batches are sent from a thread pool while the caller keeps
+    # adding actions, addAction blocks on the oldest batch once the limit is reached. results are
+    # always returned in the order actions were added, push waits for every batch in flight.
+    def __init__(self, max_actions=None, max_bytes=None, collect=True, concurrency=1, retry_policy=None):
+        self.max_actions = max_actions or getattr(settings, 'ES_BULK_MAX_ACTIONS', self.max_transaction_actions)
+        self.max_bytes = max_bytes or getattr(settings, 'ES_BULK_MAX_BYTES', self.max_transaction_size)
+        self.concurrency = concurrency
+        self.retry_policy = retry_policy or default_retry_policy
+        self.__collect = collect
         self.__actions = []
+        self.__chunks = []
         self.__results = []
         self.__action_size = 0
+        self.__pending = deque()
     def __del__(self):
         del self.__actions
+        del self.__chunks
     def addAction(self, action):
-        self.__actions.append(action)
-        self.__action_size += sys.getsizeof(str(action))
+        chunk = "".join(["%s\n" % line for line in serializeAction(action)])
+        size = len(chunk)
         results = None
-        if len(self.__actions) > 200 or self.__action_size > self.max_transaction_size:
-            results = self.push()
-            del self.__actions
-            self.__actions = []
-            self.__action_size = 0
+        if self.__actions and self.__action_size + size > self.max_bytes:
+            results = self.__flush()
+        self.__actions.append(action)
+        self.__chunks.append(chunk)
+        self.__action_size += size
+        if len(self.__actions) >= self.max_actions:
+            flushed = self.__flush()
+            results = results + flushed if results else flushed
         return results
+    @metrics.timed('es.bulk.push')
     def push(self):
-        if is_appengine_environment:
-            retry_count = 0
-            while retry_count < 5:
-                try:
-                    __results = helpers.bulk(client=es_client_conn.es, actions=self.__actions,)
-                    break
-                except DeadlineExceededError:
-                    retry_count += 1
-            if retry_count == 5:
-                raise DeadlineExceededError
-        else:
-            __results = helpers.bulk(client=es_client_conn.es, actions=self.__actions,)
-        for action in self.__actions:
-            self.__results.append(action['_id'])
+        results = self.__flush()
+        while self.__pending:
+            results.extend(self.__process(self.__pending.popleft().get()))
+        return results
+    def __flush(self):
+        if not self.__actions:
+            return []
+        chunks = self.__chunks
+        self.__actions = []
+        self.__chunks = []
+        self.__action_size = 0
+        if self.concurrency <= 1:
+            return self.__process(self.__send(chunks))
+        results = []
+        while len(self.__pending) >= self.concurrency:
+            results.extend(self.__process(self.__pending.popleft().get()))
+        self.__pending.append(getPool('bulk', self.concurrency).apply_async(self.__send, (chunks,)))
+        return results
+    def __send(self, chunks):
+        # items rejected with a retryable status are resent on their own, the rest of the batch is kept
+        results = [None] * len(chunks)
+        pending = range(len(chunks))
+        attempt = 0
+        while True:
+            body = "".join([chunks[i] for i in pending])
+            metrics.histogram('es.bulk.actions', len(pending))
+            metrics.histogram('es.bulk.bytes', len(body))
+            started = metrics.start()
+            response = self.retry_policy.call(es_client_conn.es.bulk, body=body)
+            metrics.timing('es.bulk', started)
+            retry = []
+            for i, item in zip(pending, response['items']):
+                op_type, result = item.items()[0]
+                status = result.get('status', 500)
+                results[i] = (200 <= status < 300, item)
+                if self.retry_policy.isRetryableStatus(status):
+                    retry.append(i)
+            if not retry or not self.retry_policy.wait(attempt):
+                return results
+            pending = retry
+            attempt += 1
+    def __process(self, results):
+        if not self.__collect:
+            return results
+        errors = []
+        for ok, item in results:
+            op_type, result = item.items()[0]
+            if ok:
+                self.__results.append(result['_id'])
+            else:
+                errors.append("%s: %s" % (result.get('_id'), result.get('error')))
+        if errors:
+            raise IndexException("%d document(s) failed: %s" % (len(errors), "; ".join(errors)))
+        return results
     def getResults(self):
         return self.__results
 
+def buildDocument(source, doc_type, doc_id):
+    fields = []
+    for name, value in zip(source.keys(), source.values()):
+        fields.append(EsFieldBase(name=name, value=value))
+    return EsSearchDocument(rank=source['_rank'], doc_type=doc_type, fields=fields, id=doc_id)
+
+# es 1.x leaves the status out of msearch errors, it is told from the exception named in the text
+error_statuses = (
+    ('EsRejectedExecutionException', 429),
+    ('UnavailableShardsException', 503),
+    ('NoShardAvailableActionException', 503),
+)
+
+def getErrorStatus(response):
+    if response.get('status'):
+        return response['status']
+    error = str(response.get('error'))
+    for name, status in error_statuses:
+        if name in error:
+            return status
+    return None
+
+def getMultiSearchLines(config):
+    return [{'index': config['index'], 'type': config['doc_type']}, getSearchBody(config)]
+
+def getSearchBody(config):
+    # translates the uri parameters built by getSearchConfig into a request body
+    body = {
+        'query': {'query_string': {'query': config['q'], 'default_operator': config['default_operator'], 'fields': ['_all', words_field]}},
+        'from': config['from_'],
+        'size': config['size'],
+        '_source': config['_source'].split(','),
+    }
+    if 'sort' in config:
+        field, order = config['sort'].split(':')
+        body['sort'] = [{field: {'order': order}}]
+    return body
+
+def serializeAction(action):
+    # exact ndjson lines of a bulk action, as sent over the wire
+    serializer = es_client_conn.es.transport.serializer
+    meta, data = helpers.expand_action(action)
+    lines = [serializer.dumps(meta)]
+    if data is not None:
+        lines.append(serializer.dumps(data))
+    return [line.encode('utf-8') if isinstance(line, unicode) else line for line in lines]
+
 class EsQueryObject:
     def __init__(self, query_string, doc_type, returned_fields=[], limit=25, default_operator="AND", offset=0, reverse=False, match_only=False):
         self.__config = {}
@@ -229,6 +504,8 @@ class EsQueryObject:
     def getSearchObject(self):
         # temporary fix for index query, deleting parameters to make compatible to elasticsearch api
         return deepcopy(self.__config)
+    def getCacheKey(self):
+        return json.dumps(self.__config, sort_keys=True)
     def getQueryString(self):
         return self.__config['q']
     def getLimit(self):
@@ -237,19 +514,46 @@ class EsQueryObject:
         return self.__config['from_']
 	
 class EsResultObject:
-    def __init__(self, response=None, match_only=False, reverse=False):
+    # with lazy, hits stay raw and documents wraps each one in an EsResultDocument on first access
+    def __init__(self, response=None, match_only=False, reverse=False, error=None, lazy=False):
         self.documents = []
         self.total_count = 0
+        self.error = error
 
         if not response:
             return
         self.total_count = response['hits']['total']
+        if lazy:
+            hits = response['hits']['hits']
+            if match_only:
+                hits = sorted(hits, key=lambda hit: hit['_source'].get('_rank'), reverse=not reverse)
+            self.documents = EsLazyDocuments(hits)
+            return
         for result in response['hits']['hits']:
-            doc = result['_source']
-            fields = []
-            for name, value in zip(doc.keys(), doc.values()):
-                fields.append(EsFieldBase(name=name, value=value))
-            document = EsSearchDocument(rank=doc['_rank'], doc_type=result['_type'], fields=fields, id=result['_id'])
-            self.documents.append(document)
+            self.documents.append(buildDocument(result['_source'], result['_type'], result['_id']))
         if match_only:
             self.documents = sorted(self.documents, key=lambda document: document['_rank'], reverse=not reverse)
+
+class EsLazyDocuments(object):
+    __slots__ = ('_hits', '_documents')
+
+    def __init__(self, hits):
+        self._hits = hits
+        self._documents = [None] * len(hits)
+    def __len__(self):
+        return len(self._hits)
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in xrange(*i.indices(len(self._hits)))]
+        document = self._documents[i]
+        if document is None:
+            hit = self._hits[i]
+            document = self._documents[i] = EsResultDocument(hit['_source'], hit['_type'], hit['_id'])
+        return document
+    def __iter__(self):
+        for i in xrange(len(self._hits)):
+            yield self[i]
+    def __nonzero__(self):
+        return bool(self._hits)
+    def __repr__(self):
+        return repr(list(self))
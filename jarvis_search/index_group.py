@@ -0,0 +1,82 @@
+#
+#       (C) 2013 Varun Mittal <varunmittal91@gmail.com>
+#       JARVIS program is distributed under the terms of the GNU General Public License v3
+#
+#       This file is part of JARVIS.
+#
+#       JARVIS is free software: you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation version 3 of the License.
+#
+#       JARVIS is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with JARVIS.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import heapq
+from itertools import islice
+
+from django.conf import settings
+
+from elasticsearch.exceptions import TransportError
+
+from .index import EsIndex, EsResultObject
+from .futures import getPool
+
+class EsIndexGroup:
+    # one query over several indices (per tenant, per month, ...). every index is asked for its own
+    # top offset+limit hits concurrently, the pages come sorted and are merged lazily until offset+limit
+    # hits are taken. ties keep the order of the indices. indices failing to answer are left out.
+    def __init__(self, names, concurrency=None, retry_policy=None, lazy_results=None):
+        self.indices = [EsIndex(name, retry_policy=retry_policy, lazy_results=lazy_results) for name in names]
+        self.concurrency = concurrency or getattr(settings, 'ES_GROUP_CONCURRENCY', len(self.indices))
+    def query(self, query_object):
+        if not self.indices:
+            return EsResultObject()
+        config, match_only, reverse = self.indices[0].getSearchConfig(query_object)
+        offset = config['from_']
+        limit = config['size']
+        config['from_'] = 0
+        config['size'] = offset + limit
+        pool = getPool('group', self.concurrency)
+        pending = []
+        for index in self.indices:
+            index_config = dict(config)
+            index_config['index'] = index.getName()
+            pending.append(pool.apply_async(index.readCall, ('search',), index_config))
+        total_count = 0
+        pages = []
+        for result in pending:
+            try:
+                response = result.get()
+            except TransportError:
+                continue
+            total_count += response['hits']['total']
+            pages.append(response['hits']['hits'])
+        if match_only:
+            key, descending = lambda hit: hit.get('_score'), True
+        else:
+            key, descending = lambda hit: hit['_source'].get('_rank'), not reverse
+        merged = heapq.merge(*[sortedHits(page, n, key, descending) for n, page in enumerate(pages)])
+        top = [hit for sort_key, n, i, hit in islice(merged, offset, offset + limit)]
+        response = {'hits': {'total': total_count, 'hits': top}}
+        return EsResultObject(response, match_only=match_only, reverse=reverse, lazy=self.indices[0].lazy_results)
+
+class Descending:
+    # inverts the order of a sort key for heapq.merge, which only merges ascending
+    __slots__ = ('key',)
+    def __init__(self, key):
+        self.key = key
+    def __lt__(self, other):
+        return other.key < self.key
+    def __eq__(self, other):
+        return self.key == other.key
+
+def sortedHits(hits, n, key, descending):
+    # (sort key, page, position, hit) for every hit of a page already sorted by key
+    for i, hit in enumerate(hits):
+        yield (Descending(key(hit)) if descending else key(hit)), n, i, hit
@@ -0,0 +1,155 @@
+#
+#       (C) 2013 Varun Mittal <varunmittal91@gmail.com>
+#       JARVIS program is distributed under the terms of the GNU General Public License v3
+#
+#       This file is part of JARVIS.
+#
+#       JARVIS is free software: you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation version 3 of the License.
+#
+#       JARVIS is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with JARVIS.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+from .tokenizer import stop_words, default_tokenizer, NGRAM, EDGE_NGRAM
+
+# whole words of every string field, searched together with _all
+words_field = 'all_words'
+
+class EsAnalyzer:
+    strategies = (NGRAM, EDGE_NGRAM)
+
+    # server side counterpart of EsTokenizer, text is split on whitespace, stop words are dropped
+    # and every word is expanded into grams at index time. searches use "<name>_search" which
+    # truncates words to max_gram so that words longer than max_gram still match their grams.
+    # grams leave out words shorter than min_gram and stop words, "<name>_words" keeps every
+    # lowercased word for the fields EsMapping indexes whole words into.
+    def __init__(self, name, strategy=NGRAM, min_gram=3, max_gram=12, stop_words=stop_words):
+        if strategy not in self.strategies:
+            raise ValueError("analyzer strategy should be one of: %s" % ", ".join(self.strategies))
+        self.name = name
+        self.search_name = "%s_search" % name
+        self.words_name = "%s_words" % name
+        self.strategy = strategy
+        self.min_gram = min_gram
+        self.max_gram = max_gram
+        self.stop_words = sorted([word for word in stop_words if word])
+    def getAnalysis(self):
+        stop_filter = "%s_stop" % self.name
+        gram_filter = "%s_%s" % (self.name, self.strategy)
+        truncate_filter = "%s_truncate" % self.name
+        return {
+            'filter': {
+                stop_filter: {'type': 'stop', 'stopwords': self.stop_words},
+                gram_filter: {'type': self.strategy, 'min_gram': self.min_gram, 'max_gram': self.max_gram},
+                truncate_filter: {'type': 'truncate', 'length': self.max_gram},
+            },
+            'analyzer': {
+                self.name: {
+                    'type': 'custom',
+                    'tokenizer': 'whitespace',
+                    'filter': ['lowercase', stop_filter, gram_filter],
+                },
+                self.search_name: {
+                    'type': 'custom',
+                    'tokenizer': 'whitespace',
+                    'filter': ['lowercase', stop_filter, truncate_filter],
+                },
+                self.words_name: {
+                    'type': 'custom',
+                    'tokenizer': 'whitespace',
+                    'filter': ['lowercase'],
+                },
+            },
+        }
+
+class EsMapping:
+    # queries are sent as query strings against _all and words_field, set all_analyzer for the grams
+    # to be searchable there. whole words are indexed next to the grams, as tokenize_string did: a
+    # field with an analyzer gets a "<field>.words" sub-field, with all_analyzer every string field
+    # is also copied to words_field.
+    def __init__(self, doc_type, all_analyzer=None):
+        self.doc_type = doc_type
+        self.__all_analyzer = all_analyzer
+        self.__properties = {}
+        self.__analyzers = {}
+        if all_analyzer:
+            self.__analyzers[all_analyzer.name] = all_analyzer
+    def addField(self, name, field_type='string', analyzer=None, **options):
+        field = {'type': field_type}
+        if analyzer:
+            self.__analyzers[analyzer.name] = analyzer
+            field['analyzer'] = analyzer.name
+            field['search_analyzer'] = analyzer.search_name
+            field['fields'] = {'words': {'type': 'string', 'analyzer': analyzer.words_name}}
+        if self.__all_analyzer and field_type == 'string':
+            field['copy_to'] = words_field
+        field.update(options)
+        self.__properties[name] = field
+        return self
+    def getNgramFields(self):
+        return [name for name, field in self.__properties.items() if field.get('analyzer') in self.__analyzers]
+    def getAnalyzers(self):
+        return self.__analyzers.values()
+    def getMapping(self):
+        mapping = {'properties': dict([(name, dict(field)) for name, field in self.__properties.items()])}
+        if self.__all_analyzer:
+            mapping['_all'] = {
+                'analyzer': self.__all_analyzer.name,
+                'search_analyzer': self.__all_analyzer.search_name,
+            }
+            mapping['properties'][words_field] = {'type': 'string', 'analyzer': self.__all_analyzer.words_name, 'include_in_all': False}
+            mapping['dynamic_templates'] = [{words_field: {
+                'match_mapping_type': 'string',
+                'mapping': {'type': 'string', 'copy_to': words_field},
+            }}]
+        return {self.doc_type: mapping}
+
+def getIndexBody(mappings, number_of_shards=None, number_of_replicas=None):
+    analysis = {'filter': {}, 'analyzer': {}}
+    body_mappings = {}
+    for mapping in mappings:
+        for analyzer in mapping.getAnalyzers():
+            for key, value in analyzer.getAnalysis().items():
+                analysis[key].update(value)
+        body_mappings.update(mapping.getMapping())
+    index_settings = {'analysis': analysis}
+    if number_of_shards is not None:
+        index_settings['number_of_shards'] = number_of_shards
+    if number_of_replicas is not None:
+        index_settings['number_of_replicas'] = number_of_replicas
+    return {'settings': {'index': index_settings}, 'mappings': body_mappings}
+
+def collapse_ngrams(value, tokenizer=None):
+    # reverses client side expansion done by EsStringField. the grams of every token are looked up
+    # through the tokenizer that expanded them and dropped, the words follow in their order. a word
+    # that is also a gram of another word, "the" next to "theme", was only ever sent as the gram
+    # and can not be told apart, pass a transform to migrate when those words matter.
+    tokens = value.split()
+    grams = set()
+    for token in set(tokens):
+        grams.update((tokenizer or default_tokenizer).grams(token))
+    words = []
+    seen = set()
+    for token in tokens:
+        if token not in grams and token not in seen:
+            seen.add(token)
+            words.append(token)
+    return " ".join(words)
+
+def collapseNgramFields(mappings, tokenizer=None):
+    # a migrate transform collapsing the ngram fields of mappings back to raw text, lossy as
+    # collapse_ngrams is
+    ngram_fields = dict([(mapping.doc_type, mapping.getNgramFields()) for mapping in mappings])
+    def transform(doc_type, source):
+        for field in ngram_fields.get(doc_type, []):
+            if isinstance(source.get(field), basestring):
+                source[field] = collapse_ngrams(source[field], tokenizer)
+        return source
+    return transform
@@ -0,0 +1,176 @@
+#
+#       (C) 2013 Varun Mittal <varunmittal91@gmail.com>
+#       JARVIS program is distributed under the terms of the GNU General Public License v3
+#
+#       This file is part of JARVIS.
+#
+#       JARVIS is free software: you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation version 3 of the License.
+#
+#       JARVIS is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with JARVIS.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import math
+import functools
+import time
+import socket
+import logging
+from threading import Lock
+
+from django.conf import settings
+
+# instrumentation of search and storage calls. hooks are no-ops until a sink is installed with
+# setSink, hot paths check sink before reading the clock so disabled hooks cost one global lookup.
+# timings are reported in seconds, histograms carry batch sizes and payload bytes.
+sink = None
+
+def setSink(new_sink):
+    global sink
+    sink = new_sink
+
+def getSink():
+    return sink
+
+def start():
+    if sink is None:
+        return None
+    return time.time()
+
+def timing(name, started):
+    if started is not None and sink is not None:
+        sink.timing(name, time.time() - started)
+
+def incr(name, value=1):
+    if sink is not None:
+        sink.incr(name, value)
+
+def histogram(name, value):
+    if sink is not None:
+        sink.histogram(name, value)
+
+def timed(name):
+    # decorator reporting the wall time of every call, including the ones that raise
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if sink is None:
+                return func(*args, **kwargs)
+            started = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                if sink is not None:
+                    sink.timing(name, time.time() - started)
+        return wrapper
+    return decorator
+
+class MemorySink:
+    # log scaled buckets, buckets_per_octave per doubling of the value, so percentiles of a
+    # snapshot are within ~20% of the recorded values whatever their unit
+    buckets_per_octave = 4
+
+    def __init__(self):
+        self.__lock = Lock()
+        self.reset()
+    def reset(self):
+        self.__counters = {}
+        self.__histograms = {}
+    def timing(self, name, value):
+        self.histogram(name, value)
+    def histogram(self, name, value):
+        bucket = self.__bucket(value)
+        with self.__lock:
+            try:
+                stats = self.__histograms[name]
+            except KeyError:
+                stats = self.__histograms[name] = {'count': 0, 'sum': 0, 'min': value, 'max': value, 'buckets': {}}
+            stats['count'] += 1
+            stats['sum'] += value
+            if value < stats['min']:
+                stats['min'] = value
+            if value > stats['max']:
+                stats['max'] = value
+            stats['buckets'][bucket] = stats['buckets'].get(bucket, 0) + 1
+    def incr(self, name, value=1):
+        with self.__lock:
+            self.__counters[name] = self.__counters.get(name, 0) + value
+    def __bucket(self, value):
+        if value <= 0:
+            return None
+        return int(math.floor(math.log(value, 2) * self.buckets_per_octave))
+    def __percentile(self, stats, p):
+        rank = stats['count'] * p
+        seen = 0
+        for bucket in sorted(stats['buckets'].keys()):
+            seen += stats['buckets'][bucket]
+            if seen >= rank:
+                if bucket is None:
+                    return 0
+                return min(stats['max'], max(stats['min'], 2 ** ((bucket + 1) / float(self.buckets_per_octave))))
+        return stats['max']
+    def snapshot(self):
+        with self.__lock:
+            counters = dict(self.__counters)
+            histograms = {}
+            for name, stats in self.__histograms.items():
+                histograms[name] = {
+                    'count': stats['count'],
+                    'sum': stats['sum'],
+                    'min': stats['min'],
+                    'max': stats['max'],
+                    'mean': stats['sum'] / float(stats['count']),
+                    'p50': self.__percentile(stats, 0.5),
+                    'p90': self.__percentile(stats, 0.9),
+                    'p99': self.__percentile(stats, 0.99),
+                }
+        return {'counters': counters, 'histograms': histograms}
+
+class StatsdSink:
+    # fire and forget udp datagrams in the statsd line format, timings are sent in milliseconds
+    def __init__(self, host='127.0.0.1', port=8125, prefix='jarvis'):
+        self.address = (host, port)
+        self.prefix = "%s." % prefix if prefix else ""
+        self.__socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    def __send(self, line):
+        try:
+            self.__socket.sendto(line, self.address)
+        except socket.error:
+            pass
+    def timing(self, name, value):
+        self.__send("%s%s:%.3f|ms" % (self.prefix, name, value * 1000))
+    def histogram(self, name, value):
+        self.__send("%s%s:%s|h" % (self.prefix, name, value))
+    def incr(self, name, value=1):
+        self.__send("%s%s:%s|c" % (self.prefix, name, value))
+
+class LoggingSink:
+    def __init__(self, logger=None, level=logging.DEBUG):
+        self.logger = logger or logging.getLogger('jarvis_search.metrics')
+        self.level = level
+    def timing(self, name, value):
+        self.logger.log(self.level, "timing %s %.6f", name, value)
+    def histogram(self, name, value):
+        self.logger.log(self.level, "histogram %s %s", name, value)
+    def incr(self, name, value=1):
+        self.logger.log(self.level, "count %s %s", name, value)
+
+def getConfiguredSink():
+    # ES_METRICS_SINK is one of "memory", "statsd" or "logging", ES_METRICS_STATSD holds the
+    # host, port and prefix of the statsd daemon
+    name = getattr(settings, 'ES_METRICS_SINK', None)
+    if name == 'memory':
+        return MemorySink()
+    if name == 'statsd':
+        return StatsdSink(**getattr(settings, 'ES_METRICS_STATSD', {}))
+    if name == 'logging':
+        return LoggingSink()
+    return None
+
+setSink(getConfiguredSink())
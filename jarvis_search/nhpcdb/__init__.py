@@ -1,3 +1,4 @@
 from .model import IntegerProperty, DateTimeProperty, DateProperty, TimeProperty, BlobProperty, JsonProperty, PickleProperty, TextProperty, StringProperty
 from .model import Models as Model
-from .model import put_multi
+from .model import put_multi, reconcile_schema
+from ..futures import wait_all
@@ -0,0 +1,77 @@
+import bz2
+import zlib
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+# blobs are stored as magic + codec tag + payload and bound as raw bytes. values written before
+# are hex text, readers tell them apart by the magic and fall back to the legacy decoding.
+magic = '\xfe\x01'
+header_size = len(magic) + 1
+
+class Codec:
+    def __init__(self, name, tag, compress=None, decompress=None):
+        self.name = name
+        self.tag = tag
+        self.compress = compress
+        self.decompress = decompress
+
+def getCodec(name, level=None):
+    if name in (None, 'none'):
+        return None
+    if name == 'zlib':
+        level = 6 if level is None else level
+        return Codec(name, 'z', lambda data: zlib.compress(data, level), zlib.decompress)
+    if name == 'bz2':
+        level = 9 if level is None else level
+        return Codec(name, 'b', lambda data: bz2.compress(data, level), bz2.decompress)
+    if name == 'lzma' and lzma:
+        level = 6 if level is None else level
+        return Codec(name, 'x', lambda data: lzma.compress(data, preset=level), lambda data: lzma.decompress(bytes(data)))
+    raise ValueError(name)
+
+codec_names = ['none', 'zlib', 'bz2'] + (['lzma'] if lzma else [])
+decoders = {'n': None}
+for codec_name in codec_names[1:]:
+    codec = getCodec(codec_name)
+    decoders[codec.tag] = codec.decompress
+
+def encode(data, codec=None, min_size=0):
+    # compressed only from min_size bytes on and only when it actually shrinks the value
+    if isinstance(data, unicode):
+        data = data.encode('utf-8')
+    if codec is not None and len(data) >= min_size:
+        compressed = codec.compress(data)
+        if len(compressed) < len(data):
+            return magic + codec.tag + compressed
+    return magic + 'n' + data
+
+def isEncoded(value):
+    return value[:len(magic)] == magic
+
+def decode(value, legacy_compressed=False):
+    if not isEncoded(value):
+        # hex text written by textAsBlob literals, or an encoded value sent hex encoded over json
+        try:
+            value = value.decode('hex')
+        except TypeError:
+            pass
+        if not isEncoded(value):
+            return zlib.decompress(value) if legacy_compressed else value
+    try:
+        decompress = decoders[value[len(magic)]]
+    except KeyError:
+        raise ValueError("blob codec '%s' is not available" % value[len(magic)])
+    if decompress is None:
+        return value[header_size:]
+    return decompress(buffer(value, header_size))
+
+def toHexLiteral(value):
+    # blob constant for statements and payloads that can not carry raw bytes
+    if isinstance(value, (buffer, bytearray)):
+        return "0x%s" % str(value).encode('hex')
+    raise TypeError(repr(value))
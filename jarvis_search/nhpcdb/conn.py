@@ -1,13 +1,32 @@
+import re
+from threading import Lock
+
 from django.conf import settings
 
 from cassandra.cluster import Cluster
 from cassandra import InvalidRequest
-from cassandra.query import dict_factory
+from cassandra.query import dict_factory, SimpleStatement
+from cassandra.concurrent import execute_concurrent
+
+from .conn_common import DBFuture
+from .schema import SchemaRegistry
+from .blob import toHexLiteral
+from .. import metrics
 
 class CassandraClient:
+    write_concurrency = 50
+    put_window = 1000
+
+    # statements are prepared once per table and column set and executed with bound values,
+    # the cached statements of a table are dropped whenever its schema changes. tables of Models
+    # classes are registered as they are defined and reconciled with reconcileSchema at startup,
+    # or on their first write.
     def __init__(self, keyspace):
         SERVERS = getattr(settings, 'CS_HOSTS', [])
         cluster = Cluster(SERVERS)
+        self.keyspace = keyspace
+        self.write_concurrency = getattr(settings, 'CS_WRITE_CONCURRENCY', self.write_concurrency)
+        self.put_window = getattr(settings, 'CS_PUT_WINDOW', self.put_window)
         try:
             self.session = cluster.connect(keyspace)
         except InvalidRequest as e:
@@ -16,54 +35,246 @@ class CassandraClient:
             session.set_keyspace(keyspace)
             self.session = session
         self.session.row_factory = dict_factory
+        self.schema = SchemaRegistry(self.session, keyspace)
+        self.__statements = {}
+        self.__lock = Lock()
+    def prepare(self, table_name, key, query):
+        try:
+            return self.__statements[(table_name, key)]
+        except KeyError:
+            pass
+        statement = self.session.prepare(query)
+        with self.__lock:
+            self.__statements[(table_name, key)] = statement
+        return statement
+    def forgetStatements(self, table_name):
+        with self.__lock:
+            for key in [key for key in self.__statements if key[0] == table_name]:
+                del self.__statements[key]
+    def getInsert(self, table_name, keys, rows):
+        # (statement, values) of an insert, the literal statement when a value can not be bound
+        values = decodeLiterals(rows)
+        if values is None:
+            rows = [toHexLiteral(row) if isinstance(row, (buffer, bytearray)) else row for row in rows]
+            return "insert into %s (%s) values (%s)"% (table_name, ", ".join(keys), ", ".join(rows)), None
+        query = "insert into %s (%s) values (%s)" % (table_name, ", ".join(keys), ", ".join(["?"] * len(keys)))
+        return self.prepare(table_name, ('insert',) + tuple(keys), query), values
+    def registerTable(self, table_name, table_schema):
+        self.schema.register(table_name, table_schema)
+        if getattr(settings, 'CS_SCHEMA_ON_DEFINE', False):
+            self.ensureTable(table_name, table_schema)
+    def reconcileSchema(self):
+        self.schema.reconcile()
+    def ensureTable(self, table_name, table_schema):
+        if self.schema.ensure(table_name, table_schema):
+            self.forgetStatements(table_name)
+    @metrics.timed('cs.put')
     def put(self, table_name, table_schema, rows):
-        keys = []
-        keys_append = keys.append
-        types = []
-        types_append = types.append
-        indexed = []
-        indexed_append = indexed.append
-        [(keys_append(_key), types_append(_type), indexed_append(_indexed)) for _key, _type, _indexed in table_schema]
-
-        command = "insert into %s (%s) values (%s)"% (table_name, ", ".join(keys), ", ".join(rows))
+        keys = [_key for _key, _type, _indexed in table_schema]
+        self.ensureTable(table_name, table_schema)
         try:
-            self.session.execute(command)
+            self.session.execute(*self.getInsert(table_name, keys, rows))
         except InvalidRequest:
-            desc_query = "select * from system.schema_columns where keyspace_name='nhpcdb' and columnfamily_name = '%s'" % (table_name)
-            rows = self.session.execute(desc_query)
-            if len(rows) > 0:
-                add_fields = []
-                change_fields = []
-                add_fields = set(keys) - set([row.column_name for row in rows])
-                features = ["alter table %s ADD %s %s " % (table_name, key, column_type) for key,column_type in zip(keys, types) if key in add_fields]
-                for feature in features:
-                    self.session.execute(feature)
-            else:
-                features = ["%s %s" % (key, column_type) for key,column_type in zip(keys, types)]
-                query = "create table %s (%s, PRIMARY KEY (key))" % (table_name, ", ".join(features))
-                self.session.execute(query)
-                for key, index in zip(keys, indexed):
-                    if index == 'True':
-                        index_command = "create index %s_%s on %s (%s)" % (table_name, key, table_name, key)
-                        self.session.execute(index_command)
-            self.session.execute(command)
-    def query(self, t_name, columns, conditions, limit):
+            # the table changed behind the registry, it is read again once
+            self.schema.forget(table_name)
+            self.ensureTable(table_name, table_schema)
+            self.session.execute(*self.getInsert(table_name, keys, rows))
+    @metrics.timed('cs.put_multi')
+    def put_multi(self, db_opts):
+        opts = list(db_opts)
+        metrics.histogram('cs.put_multi.rows', len(opts))
+        for success, error in self.put_ops(opts):
+            if not success:
+                raise error
+        return len(opts)
+    def put_ops(self, ops):
+        # ops is any iterable of db_opts dicts, read put_window at a time so a streamed batch never
+        # holds more than a window of rows. yields (success, error) for every op in order.
+        window = []
+        for op in ops:
+            window.append(op)
+            if len(window) >= self.put_window:
+                for result in self.__putWindow(window):
+                    yield result
+                window = []
+        if window:
+            for result in self.__putWindow(window):
+                yield result
+    def __putWindow(self, opts):
+        # rows are grouped by table so each table is checked and its statement looked up once, then
+        # written concurrently with at most write_concurrency statements in flight. rows failing with
+        # InvalidRequest are retried one by one through put. a table that can not be created or
+        # altered fails each of its rows, so does a row no statement can be built for.
+        tables = {}
+        results = [None] * len(opts)
+        pending = []
+        statements = []
+        for i, opt in enumerate(opts):
+            table_name = opt['table_name']
+            keys = tables.get(table_name)
+            if keys is None:
+                try:
+                    keys = [_key for _key, _type, _indexed in opt['table_schema']]
+                    self.ensureTable(table_name, opt['table_schema'])
+                except Exception as e:
+                    keys = e
+                tables[table_name] = keys
+            if isinstance(keys, Exception):
+                results[i] = (False, keys)
+                continue
+            try:
+                statements.append(self.getInsert(table_name, keys, opt['rows']))
+            except Exception as e:
+                results[i] = (False, e)
+                continue
+            pending.append(i)
+        for i, result in zip(pending, execute_concurrent(self.session, statements, concurrency=self.write_concurrency, raise_on_first_error=False)):
+            results[i] = result
+        for i, opt in enumerate(opts):
+            success, error = results[i]
+            if success or not isinstance(error, InvalidRequest):
+                continue
+            try:
+                self.put(opt['table_name'], opt['table_schema'], opt['rows'])
+                results[i] = (True, None)
+            except Exception as e:
+                results[i] = (False, e)
+        return results
+    def put_async(self, table_name, table_schema, rows):
+        # tables changed behind the registry fail with InvalidRequest, the blocking put then retries
+        keys = [_key for _key, _type, _indexed in table_schema]
+        self.ensureTable(table_name, table_schema)
+        def errback(e):
+            if not isinstance(e, InvalidRequest):
+                raise e
+            return self.put(table_name, table_schema, rows)
+        try:
+            statement, values = self.getInsert(table_name, keys, rows)
+        except InvalidRequest as e:
+            return DBFuture(ImmediateResult(error=e), errback=errback)
+        return DBFuture(self.session.execute_async(statement, values), errback=errback)
+    def buildQuery(self, t_name, columns, conditions, limit):
         if columns:
-            columns.append("key")
-            columns = "%s, key" % (",".join(columsn))
+            columns = "%s, key" % (",".join([column for column in columns if column != 'key']))
         else:
             columns = "*"
+        cond = ""
         if conditions:
             cond = "where %s" % " and ".join([condition for condition in conditions])
         try:
-            query = "select %s from  %s %s limit %d" % (columns, t_name, cond, limit)
+            return "select %s from  %s %s limit %d" % (columns, t_name, cond, limit)
         except TypeError:
-            query = "select %s from %s %s" % (columns, t_name, cond)
+            return "select %s from %s %s" % (columns, t_name, cond)
+    def getSelect(self, t_name, columns, conditions, limit):
+        # conditions built by the model properties ("attr op literal") are bound, the statement is
+        # keyed on the shape of the query. anything else runs as a literal statement.
+        parsed = parseConditions(conditions or [])
+        if parsed is None:
+            return self.buildQuery(t_name, columns, conditions, limit), None
+        shapes, values = parsed
+        query = self.buildQuery(t_name, columns, shapes, None)
+        if limit is not None:
+            query = "%s limit ?" % query
+            values.append(limit)
+        key = ('select', tuple(columns or ()), tuple(shapes), limit is not None)
+        return self.prepare(t_name, key, query), values
+    @metrics.timed('cs.query')
+    def query(self, t_name, columns, conditions, limit):
         try:
-            rows = cassandra_conn.session.execute(query)
+            rows = self.session.execute(*self.getSelect(t_name, columns, conditions, limit))
         except InvalidRequest:
             rows = []
         return rows
+    def query_async(self, t_name, columns, conditions, limit):
+        def errback(e):
+            if not isinstance(e, InvalidRequest):
+                raise e
+            return []
+        try:
+            statement, values = self.getSelect(t_name, columns, conditions, limit)
+        except InvalidRequest as e:
+            return DBFuture(ImmediateResult(error=e), errback=errback)
+        return DBFuture(self.session.execute_async(statement, values), errback=errback)
+
+    def query_pages(self, t_name, columns, conditions, limit, fetch_size, paging_state=None):
+        # yields (rows, paging_state) per page of fetch_size rows, the following page is fetched
+        # by the driver while the caller works on the current one
+        statement, values = self.getSelect(t_name, columns, conditions, limit)
+        if values is None:
+            statement = SimpleStatement(statement, fetch_size=fetch_size)
+        else:
+            statement = statement.bind(values)
+            statement.fetch_size = fetch_size
+        options = {'paging_state': paging_state} if paging_state else {}
+        try:
+            future = self.session.execute_async(statement, **options)
+            page = future.result()
+        except InvalidRequest:
+            return
+        while True:
+            rows = list(getattr(page, 'current_rows', page))
+            state = getattr(page, 'paging_state', None)
+            more = future.has_more_pages
+            if more:
+                future.start_fetching_next_page()
+            yield rows, state
+            if not more:
+                return
+            page = future.result()
+
+class ImmediateResult:
+    def __init__(self, result=None, error=None):
+        self.__result = result
+        self.__error = error
+    def result(self):
+        if self.__error:
+            raise self.__error
+        return self.__result
+
+blob_literal = re.compile(r"^textAsBlob\('(.*)'\)$", re.S)
+hex_literal = re.compile(r"^0x([0-9a-fA-F]*)$")
+number_literal = re.compile(r"^-?\d+$")
+condition_pattern = re.compile(r"^(\w+) (<=|>=|=|<|>) (.+)$", re.S)
+
+def decodeLiteral(literal):
+    # values as inlined by the model properties, raises ValueError for anything else. blobs come
+    # as raw bytes from the model, as 0x constants over json.
+    if isinstance(literal, (buffer, bytearray)):
+        return literal
+    if literal == 'null':
+        return None
+    if len(literal) >= 2 and literal[0] == "'" and literal[-1] == "'":
+        return literal[1:-1].replace("''", "'")
+    match = blob_literal.match(literal)
+    if match:
+        return bytearray(str(match.group(1).replace("''", "'")))
+    match = hex_literal.match(literal)
+    if match:
+        return bytearray(match.group(1).decode('hex'))
+    if number_literal.match(literal):
+        return int(literal)
+    raise ValueError(literal)
+
+def decodeLiterals(literals):
+    try:
+        return [decodeLiteral(literal if isinstance(literal, (basestring, buffer, bytearray)) else str(literal)) for literal in literals]
+    except ValueError:
+        return None
+
+def parseConditions(conditions):
+    shapes = []
+    values = []
+    for condition in conditions:
+        match = condition_pattern.match(condition)
+        if not match:
+            return None
+        try:
+            values.append(decodeLiteral(match.group(3)))
+        except ValueError:
+            return None
+        shapes.append("%s %s ?" % (match.group(1), match.group(2)))
+    return shapes, values
+
 cassandra_conn = CassandraClient('nhpcdb')
 def Query(*argv):
     return cassandra_conn.query(*argv)
@@ -1,21 +1,75 @@
-import sys
+import json
+
+from django.conf import settings
+
+from .blob import toHexLiteral
+from ..futures import EsFuture
+
+class JsonOpsWriter:
+    # ops as the json list servers before the framed protocol read. size is the uncompressed length,
+    # which bounds the compressed one.
+    def __init__(self):
+        self.__parts = []
+        self.size = 2
+    def encodeOp(self, op):
+        return json.dumps(op, default=toHexLiteral)
+    def writeOp(self, op, data):
+        self.__parts.append(data)
+        self.size += len(data) + 1
+    def addOp(self, op):
+        self.writeOp(op, self.encodeOp(op))
+    def dumps(self):
+        return "[%s]" % ",".join(self.__parts)
 
 class db_opts:
     transaction_header_size = 100
     max_transaction_size = 10000000 - transaction_header_size
+    max_transaction_rows = 5000
 
-    def __init__(self):
+    # chunks hold at most max_rows ops and max_size bytes of their encoding, compressed when the
+    # writer compresses
+    def __init__(self, max_size=None, max_rows=None):
         self._opts = []
-	self.__action_size = 0
+        self.max_size = max_size or getattr(settings, 'CS_PUT_MAX_BYTES', self.max_transaction_size)
+        self.max_rows = max_rows or getattr(settings, 'CS_PUT_MAX_ROWS', self.max_transaction_rows)
     def addOp(self, db_opt):
         self._opts.append(db_opt)
+    def __iter__(self):
+        return iter(self._opts)
+    def get_chunks(self, writer=JsonOpsWriter):
+        # writer() starts a chunk. an op is encoded before it is written and starts the next chunk
+        # when it does not fit, a single op larger than max_size goes alone. yields (ops, writer)
+        # with the writer holding the encoded chunk, _opts is left as it is.
+        chunk = writer()
+        ops = []
+        for op in self._opts:
+            data = chunk.encodeOp(op)
+            if ops and (len(ops) >= self.max_rows or chunk.size + len(data) > self.max_size):
+                yield ops, chunk
+                chunk = writer()
+                ops = []
+                data = chunk.encodeOp(op)
+            chunk.writeOp(op, data)
+            ops.append(op)
+        if ops:
+            yield ops, chunk
     def get_opts(self):
-        i = 0
-        for opt in self._opts:
-            self.__action_size += (sys.getsizeof(opt) + 3)
-            if self.__action_size > self.max_transaction_size:
-                yield self._opts[:i]
-                self._opts = self._opts[i:]
-                self.__action_size = 0
-            i += 1
-        yield self._opts
+        # the chunks of get_chunks without encoding anything, cut on an estimate of the json size
+        # that hex encoded blobs and escapes can exceed. use get_chunks when the limit is strict.
+        ops = []
+        size = 2
+        for op in self._opts:
+            op_size = len(op['table_name']) + 32 * len(op['table_schema'])
+            for value in op['rows']:
+                op_size += (2 * len(value) if isinstance(value, (buffer, bytearray)) else len(value)) + 4
+            if ops and (len(ops) >= self.max_rows or size + op_size > self.max_size):
+                yield ops
+                ops = []
+                size = 2
+            ops.append(op)
+            size += op_size
+        if ops:
+            yield ops
+
+# nhpcdb reads and writes return the futures of the search side
+DBFuture = EsFuture
@@ -1,19 +1,42 @@
+import os
+import base64
 import requests
 import json
+from threading import Lock
+from collections import deque
 from zlib import compress as zlib_compress, decompress as zlib_decompress
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
+from requests.exceptions import RequestException
 
 from django.conf import settings
 
+from .conn_common import DBFuture, JsonOpsWriter
+from .exceptions import NhpcDBPutFailed
+from . import wire
+from .. import metrics
+from ..hosts import HostSelector
+from ..futures import getPool
+from ..retry import RetryPolicy
+
 try:
     from jarvis_frontend.utilities import isDevelopmentServer
     is_appengine_env = True
 except:
     is_appengine_env = False
 
+try:
+    from google.appengine.api import urlfetch
+except ImportError:
+    urlfetch = None
+
 class CassandraClientWeb:
-    def __init__(self, keyspace):
-        SERVERS = getattr(settings, 'CS_HOSTS', [])
+    max_connections_per_host = 10
+    put_concurrency = 4
+    timeout = 60
+
+    def __init__(self, keyspace, servers=None):
+        SERVERS = getattr(settings, 'CS_HOSTS', []) if servers is None else servers
         if is_appengine_env:
             if isDevelopmentServer():
                	__servers = []
@@ -23,31 +46,171 @@ class CassandraClientWeb:
                     __servers.append(server)
                 SERVERS = __servers
         for server in SERVERS:
-            if 'use_ssl' and server['use_ssl'] == True:
+            if 'use_ssl' in server and server['use_ssl'] == True:
                 url = "https://%s:%s/" % (server['host'], server['port'])
             else:
                 url = "http://%s:%s/" % (server['host'], server['port'])
             server['url'] = url
         self.SERVERS = SERVERS
+        self.async_pool_size = getattr(settings, 'CS_ASYNC_POOL_SIZE', 10)
+        # 'json' talks to servers that predate the binary framing
+        self.protocol = getattr(settings, 'CS_WEB_PROTOCOL', 'binary')
+        self.max_connections_per_host = getattr(settings, 'CS_MAX_CONNECTIONS_PER_HOST', self.max_connections_per_host)
+        self.timeout = getattr(settings, 'CS_TIMEOUT', self.timeout)
+        self.hosts = HostSelector(SERVERS, round_robin=True, **getattr(settings, 'CS_HOST_HEALTH_OPTIONS', {}))
+        self.put_concurrency = getattr(settings, 'CS_PUT_CONCURRENCY', self.put_concurrency)
+        self.retry_policy = RetryPolicy(
+            max_retries=getattr(settings, 'CS_RETRY_MAX', 3),
+            backoff=getattr(settings, 'CS_RETRY_BACKOFF', 0.05),
+            max_backoff=getattr(settings, 'CS_RETRY_MAX_BACKOFF', 5.0),
+            retryable_exceptions=(RequestException,),
+        )
+        self.__session = None
+        self.__pid = None
+        self.__lock = Lock()
+    @property
+    def session(self):
+        # keep-alive session shared by every host, rebuilt when used from another process
+        if self.__session is None or self.__pid != os.getpid():
+            with self.__lock:
+                if self.__pid != os.getpid():
+                    self.__session = None
+                    self.__pid = os.getpid()
+                if self.__session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=max(len(self.SERVERS), 1),
+                            pool_maxsize=self.max_connections_per_host)
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    self.__session = session
+        return self.__session
+    def registerTable(self, table_name, table_schema):
+        # the server reconciles schema on its side
+        pass
+    def reconcileSchema(self):
+        pass
+    def opsWriter(self):
+        if self.protocol == 'binary':
+            return wire.OpsWriter()
+        return JsonOpsWriter()
+    def encodeChunk(self, chunk):
+        if self.protocol == 'binary':
+            return chunk.dumps(), {'Content-Type': wire.content_type}
+        return zlib_compress(chunk.dumps()), {}
+    def encodeOps(self, ops):
+        chunk = self.opsWriter()
+        for op in ops:
+            chunk.addOp(op)
+        return self.encodeChunk(chunk)
+    def encodeQuery(self, query):
+        if self.protocol == 'binary':
+            return wire.dumps(wire.query_frame, [query]), {'Content-Type': wire.content_type}
+        return zlib_compress(json.dumps(query)), {}
+    def decodeStatus(self, content):
+        # {'rows': handled, 'failed': [[index, error], ...]}, empty from servers that predate the report
+        if not content:
+            return None
+        if wire.isFramed(content):
+            return [value for kind, value in wire.iterFrames(content) if kind == wire.status_frame][0]
+        return json.loads(zlib_decompress(content))
+    def checkStatus(self, content, count):
+        # raises NhpcDBPutFailed unless the server reports every one of the count rows sent written
+        status = self.decodeStatus(content)
+        if status is not None and (status['failed'] or status['rows'] < count):
+            raise NhpcDBPutFailed(status, count)
+        return status
+    def decodeRows(self, content):
+        if wire.isFramed(content):
+            return wire.loadRows(content)
+        return json.loads(zlib_decompress(content))
+    @metrics.timed('cs.web.put')
     def put(self, table_name, table_schema, rows, db_opts=None):
         if db_opts:
-            db_opts.addOp({'schema': table_schema, 'rows': rows, 't_name': table_name})
+            db_opts.addOp({'table_name': table_name, 'table_schema': table_schema, 'rows': rows})
             return
-        server = self.SERVERS[0]
-        credentials = server['http_auth'].split(':')
-        r = requests.post("%s/nhpcdb/put/" % server['url'], auth=HTTPBasicAuth(credentials[0], credentials[1]), 
-                data=zlib_compress(json.dumps({'schema': table_schema, 'rows': rows, 't_name': table_name})))
+        data, headers = self.encodeOps([{'table_name': table_name, 'table_schema': table_schema, 'rows': rows}])
+        metrics.histogram('cs.web.bytes', len(data))
+        return self.checkStatus(self.__post("nhpcdb/put/", data, headers).content, 1)
+    @metrics.timed('cs.web.put_multi')
     def put_multi(self, db_opts):
-        server = self.SERVERS[0]
-        credentials = server['http_auth'].split(':')
-        for opts in db_opts.get_opts():
-            r = requests.post("%s/nhpcdb/put/" % server['url'], auth=HTTPBasicAuth(credentials[0], credentials[1]),
-                    data=zlib_compress(json.dumps(opts)), timeout=60)
+        # chunks are encoded while earlier ones are posted, at most put_concurrency at a time. a chunk
+        # failing on the network or with a 5xx is posted again under retry_policy, writing its rows
+        # twice is harmless. the reports of the chunks are merged with failed rows indexed by their
+        # position in db_opts, rows of a chunk that gave up or was cut short are reported failed.
+        # like CassandraClient.put_multi the number of rows is returned once every chunk is done,
+        # NhpcDBPutFailed carries the merged report when any row failed.
+        report = {'rows': 0, 'failed': []}
+        pool = getPool('cs.web.put', self.put_concurrency)
+        pending = deque()
+        offset = 0
+        for ops, chunk in db_opts.get_chunks(self.opsWriter):
+            data, headers = self.encodeChunk(chunk)
+            metrics.histogram('cs.web.batch', len(ops))
+            metrics.histogram('cs.web.bytes', len(data))
+            while len(pending) >= self.put_concurrency:
+                self.__merge(report, *pending.popleft())
+            pending.append((offset, len(ops), pool.apply_async(self.__putChunk, (data, headers))))
+            offset += len(ops)
+        while pending:
+            self.__merge(report, *pending.popleft())
+        if report['failed']:
+            raise NhpcDBPutFailed(report, offset)
+        return report['rows']
+    def __putChunk(self, data, headers):
+        try:
+            return True, self.decodeStatus(self.retry_policy.call(self.__post, "nhpcdb/put/", data, headers).content)
+        except Exception as e:
+            return False, "%s: %s" % (e.__class__.__name__, e)
+    def __merge(self, report, offset, count, result):
+        success, status = result.get()
+        if status is None:
+            # servers that predate the report answer with an empty body
+            report['rows'] += count
+            return
+        if not success:
+            report['failed'].extend([[offset + i, status] for i in xrange(count)])
+            report['rows'] += count
+            return
+        report['failed'].extend([[offset + i, error] for i, error in status['failed']])
+        report['failed'].extend([[offset + i, status.get('error', "not written")] for i in xrange(status['rows'], count)])
+        report['rows'] += count
+    @metrics.timed('cs.web.query')
     def query(self, t_name, columns, conditions, limit):
-        server = self.SERVERS[0]
-        credentials = server['http_auth'].split(':')
-        r = requests.post("%s/nhpcdb/query/" % server['url'], auth=HTTPBasicAuth(credentials[0], credentials[1]),
-                data=zlib_compress(json.dumps({'t_name': t_name, 'columns': columns, 'cond': conditions, 'limit': limit})), timeout=60)
-        rows = json.loads(zlib_decompress(r.content))
-        return rows
+        data, headers = self.encodeQuery({'t_name': t_name, 'columns': columns, 'cond': conditions, 'limit': limit})
+        r = self.__post("nhpcdb/query/", data, headers)
+        metrics.histogram('cs.web.bytes', len(r.content))
+        return self.decodeRows(r.content)
+    def query_pages(self, t_name, columns, conditions, limit, fetch_size, paging_state=None):
+        # the web protocol has no paging, every row comes back as a single page
+        yield self.query(t_name, columns, conditions, limit), None
+    def put_async(self, table_name, table_schema, rows):
+        data, headers = self.encodeOps([{'table_name': table_name, 'table_schema': table_schema, 'rows': rows}])
+        return self.__post_async("nhpcdb/put/", data, headers, callback=lambda content: self.checkStatus(content, 1))
+    def query_async(self, t_name, columns, conditions, limit):
+        data, headers = self.encodeQuery({'t_name': t_name, 'columns': columns, 'cond': conditions, 'limit': limit})
+        return self.__post_async("nhpcdb/query/", data, headers, callback=self.decodeRows)
+    def __post(self, path, data, headers):
+        # requests take turns over the hosts with a closed circuit, failing hosts are skipped for a while
+        def post(host):
+            server = host.server
+            credentials = server['http_auth'].split(':')
+            r = self.session.post("%s%s" % (server['url'], path), auth=HTTPBasicAuth(credentials[0], credentials[1]),
+                    data=data, headers=headers, timeout=self.timeout)
+            if r.status_code >= 500:
+                r.raise_for_status()
+            return r
+        return self.hosts.call(post)
+    def __post_async(self, path, data, headers, callback=None):
+        # urlfetch rpcs run concurrently without threads on app engine, elsewhere requests run on a shared pool
+        metrics.histogram('cs.web.bytes', len(data))
+        if urlfetch:
+            server = self.hosts.choose().server
+            rpc = urlfetch.create_rpc(deadline=self.timeout)
+            headers = dict(headers, Authorization="Basic %s" % base64.b64encode(server['http_auth']))
+            urlfetch.make_fetch_call(rpc, "%s%s" % (server['url'], path), payload=data, method=urlfetch.POST, headers=headers)
+            return DBFuture(rpc, callback=lambda response: callback(response.content) if callback else None)
+        def post():
+            r = self.__post(path, data, headers)
+            return callback(r.content) if callback else None
+        return DBFuture(getPool('cs.web.async', self.async_pool_size).apply_async(post))
 cassandra_conn = CassandraClientWeb('nhpcdb')
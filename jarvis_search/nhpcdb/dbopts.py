@@ -1,5 +1,5 @@
 import json
-from zlib import decompress as zlib_decompress, compress as zlib_compress
+from zlib import decompress as zlib_decompress, compress as zlib_compress, error as zlib_error
 
 from django.http import HttpResponse, HttpResponseBadRequest
 from django.views.decorators.csrf import csrf_exempt
@@ -7,33 +7,76 @@ from django.views.decorators.csrf import csrf_exempt
 from cassandra import InvalidRequest
 
 from .conn import cassandra_conn
+from .blob import isEncoded
+from . import wire
+
+def isFramed(request):
+    return request.META.get('CONTENT_TYPE', '').split(';')[0] == wire.content_type
+
+def readOps(request):
+    # framed bodies are decoded one op at a time as they are read. json bodies from older clients hold
+    # either the ops queued by Models or a single op with t_name and schema. anything that can not
+    # be read as an op raises WireError.
+    try:
+        if isFramed(request):
+            ops = wire.loadOps(request)
+        else:
+            ops = json.loads(zlib_decompress(request.body))
+            if type(ops) != list:
+                ops = [{'table_name': ops['t_name'], 'table_schema': ops['schema'], 'rows': ops['rows']}]
+        ops = iter(ops)
+    except (KeyError, TypeError, ValueError, zlib_error) as e:
+        raise wire.WireError("invalid body, %s: %s" % (e.__class__.__name__, e))
+    while True:
+        try:
+            op = next(ops)
+            op = {'table_name': op['table_name'].lower(), 'table_schema': op['table_schema'], 'rows': op['rows']}
+        except StopIteration:
+            return
+        except (KeyError, AttributeError, TypeError, ValueError, zlib_error) as e:
+            raise wire.WireError("invalid op, %s: %s" % (e.__class__.__name__, e))
+        yield op
+
+def respond(request, data, response_class=HttpResponse):
+    if isFramed(request):
+        return response_class(wire.dumps(wire.status_frame, [data]), content_type=wire.content_type)
+    return response_class(zlib_compress(json.dumps(data)))
 
 @csrf_exempt
 def put(request):
-    results = []
+    # rows are written put_window at a time while the body is still being read. the report holds the
+    # number of rows handled and the index and error of each failed row. a malformed body stops the
+    # batch with a 400, what was read of the window at that point is not written.
+    report = {'rows': 0, 'failed': []}
     try:
-        data = eval(zlib_decompress(request.body))
-        if type(data) == list:
-            for row in data:
-                results.append(cassandra_conn.put(**row))
-        else:
-            table  = data['t_name'].lower()
-            schema = data['schema']
-            rows   = data['rows']
-            results.append(cassandra_conn.put(table_name=table, table_schema=schema, rows=rows))
-    except KeyError:
-        return HttpResponseBadRequest("Invalid request")
-    return HttpResponse()
+        for i, (success, error) in enumerate(cassandra_conn.put_ops(readOps(request))):
+            report['rows'] += 1
+            if not success:
+                report['failed'].append([i, "%s: %s" % (error.__class__.__name__, error)])
+    except wire.WireError as e:
+        report['error'] = "Invalid request: %s" % e
+        return respond(request, report, HttpResponseBadRequest)
+    return respond(request, report)
 
 @csrf_exempt
 def query(request):
     try:
-        data = eval(zlib_decompress(request.body))
+        if isFramed(request):
+            data = [value for kind, value in wire.iterFrames(request) if kind == wire.query_frame][0]
+        else:
+            data = json.loads(zlib_decompress(request.body))
         t_name = data['t_name']
         columns = data['columns']
         conditions = data['cond']
         limit = data['limit']
-    except KeyError:
+    except (KeyError, IndexError, TypeError, ValueError, zlib_error):
         return HttpResponseBadRequest("Invalid request")
-    rows = cassandra_conn.query(t_name=t_name, columns=columns, limit=limit, conditions=conditions)
+    rows = list(cassandra_conn.query(t_name=t_name, columns=columns, limit=limit, conditions=conditions))
+    if isFramed(request):
+        return HttpResponse(wire.dumpRows(rows), content_type=wire.content_type)
+    # raw blobs can not travel in json, they are sent hex encoded and decoded by the properties
+    for row in rows:
+        for key, value in row.items():
+            if isinstance(value, str) and isEncoded(value):
+                row[key] = value.encode('hex')
     return HttpResponse(zlib_compress(json.dumps(rows)))
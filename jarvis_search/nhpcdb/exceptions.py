@@ -21,3 +21,10 @@ class NhpcDBFieldRequired(NhpcDBException):
 class NhpcDBInvalidValue(NhpcDBException):
     def __init__(self, classname, req_classname):
         self._msg = "'%s' should be '%s'" % (classname, req_classname)
+
+class NhpcDBPutFailed(NhpcDBException):
+    # report is what the server answered, {'rows': handled, 'failed': [[index, error], ...]}
+    def __init__(self, report, count):
+        self.report = report
+        failed = report.get('failed') or [[None, report.get('error', "not written")]]
+        self._msg = "%d of %d rows not written, first error: %s" % (max(len(failed), count - report.get('rows', 0)), count, failed[0][1])
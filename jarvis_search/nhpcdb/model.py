@@ -1,5 +1,4 @@
 from uuid import uuid4
-import zlib
 import json
 try:
     import cPickle as pickle
@@ -14,6 +13,7 @@ from datetime import datetime, timedelta
 from .exceptions import NhpcDBInvalidAttribute, NhpcDBFieldNotImplemented, NhpcDBFieldRequired, NhpcDBInvalidValue, NhpcDBInvalidProperty 
 from .query import NhpcDBQueryObject
 from .conn_common import db_opts
+from . import blob
 try:
     from .conn import cassandra_conn
 except ImportError:
@@ -139,33 +139,35 @@ class StringProperty(DBProperty):
 
 class BlobProperty(DBProperty):
     _type = 'blob'
+    min_compress_size = 128
 
-    def __init__(self, compressed=False, required=False, default=None):
+    # values are bound as raw bytes tagged with their codec: none, zlib, bz2 or lzma (when
+    # available). compressed=True picks zlib, values under min_size bytes are never compressed.
+    def __init__(self, compressed=False, required=False, default=None, codec=None, level=None, min_size=None):
         self._compressed=compressed
+        if codec is None and compressed:
+            codec = 'zlib'
+        try:
+            self._codec = blob.getCodec(codec, level)
+        except ValueError:
+            raise NhpcDBInvalidProperty(["codec"], "one of %s" % ", ".join(blob.codec_names))
+        self._min_size = self.min_compress_size if min_size is None else min_size
         if default != None:
             self._value = self.__validate(default)
         super(BlobProperty, self).__init__(required=required)
     def getValue(self, attr, is_new, value=None):
         if value:
-            return {'attr': attr, 'value': "textAsBlob('%s')" % value.encode("hex"), '_t': self._type, 'indexed': self._indexed}
+            return {'attr': attr, 'value': buffer(value), '_t': self._type, 'indexed': self._indexed}
         else: 
             return {'attr': attr, 'value': 'null', '_t': self._type, 'indexed': self._indexed}
     def setValue(self, value):
         return self.__validate(value)
     def __validate(self, value):
-        if self._compressed:
-            value = zlib.compress(value)
-        return value
+        return blob.encode(value, self._codec, self._min_size)
     def readValue(self, value):
         return self._decompress(value)
     def _decompress(self, value):
-        try:
-            value = value.decode('hex')
-        except TypeError:
-            pass
-        if self._compressed:
-            return zlib.decompress(value)
-        return value
+        return blob.decode(value, self._compressed)
 
 TextProperty = BlobProperty
 class JsonProperty(BlobProperty):
@@ -183,10 +185,10 @@ class PickleProperty(BlobProperty):
         default = kwargs.get('default', None)
         required = kwargs.get('required', None)
         if default != None:
-            kwargs['default'] = pickle.dumps(default)
+            kwargs['default'] = pickle.dumps(default, pickle.HIGHEST_PROTOCOL)
         super(PickleProperty, self).__init__(**kwargs)
     def setValue(self, value):
-        return super(PickleProperty, self).setValue(pickle.dumps(value))
+        return super(PickleProperty, self).setValue(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
     def readValue(self, value):
         try:
             value = self._decompress(value)
@@ -194,6 +196,24 @@ class PickleProperty(BlobProperty):
         except AttributeError:
             return None
 
+class ColumnAttribute(object):
+    # installed by BaseClass for every column. the decoded value is stored in the instance dict so
+    # later reads are plain attribute lookups, Models.__setattr__ encodes assigned values and drops
+    # the decoded copy. on the class the column itself is returned, for building conditions.
+    def __init__(self, name, column):
+        self.name = name
+        self.column = column
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self.column
+        value = instance._attributes.get(self.name)
+        if value:
+            value = self.column.readValue(value)
+        else:
+            value = None
+        instance.__dict__[self.name] = value
+        return value
+
 class BaseClass(type):
     def __init__(self, name, bases, attr, **kwargs):
         self._columns = OrderedDict()
@@ -208,6 +228,13 @@ class BaseClass(type):
                 field_type.getValue(field_name, False)
         super(BaseClass, self).__init__(name, bases, attr)
         self.name = super(BaseClass, self).__name__.lower()
+        for field_name, field_type in self._columns.items():
+            if field_name != '_key':
+                setattr(self, field_name, ColumnAttribute(field_name, field_type))
+        self._table_schema = [[key, cassandra_types[column._type], str(column._indexed)] for key,column in self._columns.items()]
+        self._row_plans = {}
+        if any([isinstance(base, BaseClass) for base in bases]):
+            cassandra_conn.registerTable(name, self._table_schema)
 
 class Models(object):
     __metaclass__ = BaseClass
@@ -236,41 +263,72 @@ class Models(object):
         attributes['key'] = self._key.setValue(self.__key)
     def getFields(self):
         return self._attributes.keys()
-    def __getattribute__(self, name):
-        _columns = super(Models, self).__getattribute__('_columns')
+    def __setattr__(self, name, value):
+        column = self._columns.get(name)
+        if column is None or name == '_key':
+            return super(Models, self).__setattr__(name, value)
+        self._attributes[name] = column.setValue(value)
+        self.__dict__.pop(name, None)
+    @classmethod
+    def fromRows(cls, rows, projection=None):
+        # instances are built straight from row dicts without running __init__, the columns to
+        # copy are worked out once per projection and values stay encoded until they are read
+        plan_key = tuple(projection) if projection else None
         try:
-            column = _columns[name]
-            _attributes = super(Models, self).__getattribute__('_attributes')
-            value = _attributes.get(name)
-            if not value:
-                return
-            return column.readValue(value)
-        except (KeyError, AttributeError):
-            return super(Models, self).__getattribute__(name)
+            plan = cls._row_plans[plan_key]
+        except KeyError:
+            plan = cls._row_plans[plan_key] = tuple(projection or cls._columns.keys())
+        quote = cls._key.setValue
+        new = object.__new__
+        models = []
+        models_append = models.append
+        for row in rows:
+            key = row['key']
+            attributes = {'key': quote(key)}
+            for name in plan:
+                attributes[name] = row.get(name)
+            model = new(cls)
+            # same state as __init__ leaves, set without going through __setattr__
+            state = model.__dict__
+            state['_attributes'] = attributes
+            state['_new_instance'] = False
+            state['_Models__key'] = key
+            models_append(model)
+        return models
     def loadRow(self, row, projection):
         if not projection:
             projection = self._columns.keys()
         for key in projection:
             value = row.get(key, None)
             self._attributes[key] = value
+            self.__dict__.pop(key, None)
     def key(self):
         return self._key
     @classmethod
     def query(*args):
         return NhpcDBQueryObject(args[0], args[1:])
     def put(self, db_opts=None):
+        db_opt = self.__getDbOpt()
+        if not db_opts:
+            return cassandra_conn.put(**db_opt)
+        db_opts.addOp(db_opt)
+    def put_async(self):
+        return cassandra_conn.put_async(**self.__getDbOpt())
+    def __getDbOpt(self):
         values = []
         values_append = values.append
         attributes = self._attributes
         for attr,column in self._columns.items():
-            value = column.getValue(attr, self._new_instance, attributes[attr])
-            values_append(str(value['value']))
+            value = column.getValue(attr, self._new_instance, attributes[attr])['value']
+            values_append(value if isinstance(value, buffer) else str(value))
         db_opt = {'table_name': self.__class__.__name__, 
-	          'table_schema': [[key, cassandra_types[column._type], str(column._indexed)] for key,column in self._columns.items()], 
+	          'table_schema': self._table_schema, 
                   'rows': values}
-        if not db_opts:
-            return cassandra_conn.put(**db_opt)
-        db_opts.addOp(db_opt)
+        return db_opt
+
+def reconcile_schema():
+    # creates or extends the tables of every Models class defined so far, meant to run at startup
+    return cassandra_conn.reconcileSchema()
 
 def put_multi(models):
     db_opt = db_opts()
@@ -1,9 +1,8 @@
-from copy import deepcopy
-
 try:
     from .conn import cassandra_conn
 except ImportError:
     from .conn_webi import cassandra_conn
+from .conn_common import DBFuture
 
 class NhpcDBQueryObject:
     def __init__(self, trgt_class, conditions):
@@ -14,14 +13,21 @@ class NhpcDBQueryObject:
         self.__model_t = trgt_class
         self.__t_name  = trgt_class.name
         self.__cond    = conditions
-    def fetch(limit=10):
-        pass
+    def fetch(self, limit=1000, projection=[]):
+        return self.fetch_async(limit, projection).get_result()
     def fetch_async(self, limit=1000, projection=[]):
-        results = []
-
-        rows = cassandra_conn.query(self.__t_name, projection, self.__cond, limit)
-        for row in rows:
-            new_model = deepcopy(self.__model_t)(key=row['key'])
-            new_model.loadRow(row, projection)
-            results.append(new_model)
-        return results
+        # returns a DBFuture of the hydrated models, the query runs while the caller goes on
+        future = cassandra_conn.query_async(self.__t_name, projection, self.__cond, limit)
+        return DBFuture(future, callback=lambda rows: self.__hydrate(rows, projection))
+    fetch_future = fetch_async
+    def fetch_pages(self, page_size=100, projection=[], paging_state=None, limit=None):
+        # yields (models, paging_state) a page at a time, the next page is requested before the
+        # current one is handed out. a paging_state passed back in resumes after its page.
+        for rows, state in cassandra_conn.query_pages(self.__t_name, projection, self.__cond, limit, page_size, paging_state):
+            yield self.__hydrate(rows, projection), state
+    def fetch_iter(self, page_size=100, projection=[], paging_state=None, limit=None):
+        for models, state in self.fetch_pages(page_size, projection, paging_state, limit):
+            for model in models:
+                yield model
+    def __hydrate(self, rows, projection):
+        return self.__model_t.fromRows(rows, projection)
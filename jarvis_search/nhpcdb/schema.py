@@ -0,0 +1,75 @@
+from threading import RLock
+
+from cassandra import InvalidRequest, AlreadyExists
+
+# what cassandra answers to ddl another process already ran
+lost_race_messages = ('already exists', 'conflicts with an existing column')
+
+class SchemaRegistry:
+    # columns of every table this process has read or created. ensure is a set lookup once a table
+    # is known, unknown tables are read from the system schema once and missing tables, columns
+    # and indexes are added under a lock. ddl that loses a race against another process is
+    # treated as done, so reconciling twice is harmless.
+    def __init__(self, session, keyspace):
+        self.session = session
+        self.keyspace = keyspace
+        self.__tables = {}
+        self.__models = {}
+        self.__lock = RLock()
+    def register(self, table_name, table_schema):
+        with self.__lock:
+            self.__models[table_name.lower()] = (table_name, table_schema)
+    def reconcile(self):
+        with self.__lock:
+            models = self.__models.values()
+        for table_name, table_schema in models:
+            self.ensure(table_name, table_schema)
+    def isKnown(self, table_name, keys):
+        columns = self.__tables.get(table_name.lower())
+        return columns is not None and columns.issuperset(keys)
+    def ensure(self, table_name, table_schema):
+        # True when ddl was run for the table
+        if self.isKnown(table_name, [_key for _key, _type, _indexed in table_schema]):
+            return False
+        with self.__lock:
+            name = table_name.lower()
+            columns = self.__tables.get(name)
+            if columns is None:
+                columns = self.__load(name)
+            if not columns:
+                columns = self.__create(table_name, table_schema)
+            for _key, _type, _indexed in table_schema:
+                if _key in columns:
+                    continue
+                self.__execute("alter table %s ADD %s %s" % (table_name, _key, _type))
+                if _indexed == 'True':
+                    self.__execute("create index %s_%s on %s (%s)" % (table_name, _key, table_name, _key))
+                columns.add(_key)
+            self.__tables[name] = columns
+            return True
+    def forget(self, table_name):
+        with self.__lock:
+            self.__tables.pop(table_name.lower(), None)
+    def __load(self, name):
+        rows = self.session.execute("select column_name from system.schema_columns where keyspace_name = %s and columnfamily_name = %s", (self.keyspace, name))
+        return set([row['column_name'] for row in rows])
+    def __create(self, table_name, table_schema):
+        features = ["%s %s" % (_key, _type) for _key, _type, _indexed in table_schema]
+        if not self.__execute("create table %s (%s, PRIMARY KEY (key))" % (table_name, ", ".join(features))):
+            return self.__load(table_name.lower())
+        for _key, _type, _indexed in table_schema:
+            if _indexed == 'True':
+                self.__execute("create index %s_%s on %s (%s)" % (table_name, _key, table_name, _key))
+        return set([_key for _key, _type, _indexed in table_schema])
+    def __execute(self, ddl):
+        # False when another process got there first, any other rejection of the ddl is raised
+        try:
+            self.session.execute(ddl)
+        except AlreadyExists:
+            return False
+        except InvalidRequest as e:
+            message = str(e).lower()
+            if not [pattern for pattern in lost_race_messages if pattern in message]:
+                raise
+            return False
+        return True
@@ -0,0 +1,322 @@
+import struct
+import zlib
+from cStringIO import StringIO
+from uuid import UUID
+from datetime import datetime
+
+# binary framing between CassandraClientWeb and the nhpcdb endpoints. a stream is magic, version and
+# flags followed by frames of kind byte + 4 byte length + value, after the header everything goes
+# through a single zlib stream when flags has compressed set. values are typed, nothing is evaluated.
+# the last frame is an end frame holding the number of frames before it, a stream without it was cut
+# short and is rejected.
+magic = 'NHDB'
+version = 1
+compressed_flag = 1
+content_type = 'application/x-nhpcdb'
+
+# frame kinds, an op frame holds the row of the table named by the table frame before it
+table_frame = 'T'
+op_frame = 'O'
+query_frame = 'Q'
+columns_frame = 'C'
+row_frame = 'R'
+status_frame = 'S'
+end_frame = 'E'
+
+header = struct.Struct('>4sBB')
+frame_header = struct.Struct('>cI')
+length = struct.Struct('>I')
+int64 = struct.Struct('>q')
+double = struct.Struct('>d')
+epoch = datetime(1970, 1, 1)
+read_size = 65536
+
+class WireError(ValueError):
+    pass
+
+def encodeValue(value, out):
+    # str is cql literal text, buffer and bytearray are raw blob bytes, both come back as they went
+    t = type(value)
+    if t is str:
+        out.append('s' + length.pack(len(value)) + value)
+    elif t is unicode:
+        value = value.encode('utf-8')
+        out.append('u' + length.pack(len(value)) + value)
+    elif t is list or t is tuple:
+        out.append('L' + length.pack(len(value)))
+        for item in value:
+            encodeValue(item, out)
+    elif value is None:
+        out.append('N')
+    elif t is bool:
+        out.append('T' if value else 'F')
+    elif t is int or t is long:
+        if -0x8000000000000000 <= value <= 0x7fffffffffffffff:
+            out.append('i' + int64.pack(value))
+        else:
+            value = str(value)
+            out.append('n' + length.pack(len(value)) + value)
+    elif t is float:
+        out.append('d' + double.pack(value))
+    elif t is buffer or t is bytearray:
+        out.append('b' + length.pack(len(value)))
+        out.append(str(value))
+    elif t is dict:
+        out.append('M' + length.pack(len(value)))
+        for key, item in value.iteritems():
+            encodeValue(key, out)
+            encodeValue(item, out)
+    elif t is datetime:
+        delta = value.replace(tzinfo=None) - epoch
+        out.append('t' + int64.pack((delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds))
+    elif t is UUID:
+        out.append('g' + value.bytes)
+    else:
+        raise TypeError("%r can not be sent over the wire" % value)
+
+def decodeValue(data, i):
+    tag = data[i]
+    i += 1
+    if tag == 's' or tag == 'u' or tag == 'b' or tag == 'n':
+        size = length.unpack_from(data, i)[0]
+        i += 4
+        value = data[i:i+size]
+        if len(value) != size:
+            raise WireError("truncated value")
+        i += size
+        if tag == 'u':
+            return value.decode('utf-8'), i
+        if tag == 'b':
+            return buffer(value), i
+        if tag == 'n':
+            try:
+                return long(value), i
+            except ValueError:
+                raise WireError("invalid number")
+        return value, i
+    if tag == 'i':
+        return int64.unpack_from(data, i)[0], i + 8
+    if tag == 'N':
+        return None, i
+    if tag == 'L':
+        count = length.unpack_from(data, i)[0]
+        i += 4
+        items = []
+        for n in xrange(count):
+            item, i = decodeValue(data, i)
+            items.append(item)
+        return items, i
+    if tag == 'M':
+        count = length.unpack_from(data, i)[0]
+        i += 4
+        items = {}
+        for n in xrange(count):
+            key, i = decodeValue(data, i)
+            items[key], i = decodeValue(data, i)
+        return items, i
+    if tag == 'T':
+        return True, i
+    if tag == 'F':
+        return False, i
+    if tag == 'd':
+        return double.unpack_from(data, i)[0], i + 8
+    if tag == 't':
+        micros = int64.unpack_from(data, i)[0]
+        return datetime.utcfromtimestamp(micros // 1000000).replace(microsecond=micros % 1000000), i + 8
+    if tag == 'g':
+        if len(data) < i + 16:
+            raise WireError("truncated value")
+        return UUID(bytes=data[i:i+16]), i + 16
+    raise WireError("unknown value tag %r" % tag)
+
+def decodeFrame(data):
+    try:
+        value, i = decodeValue(data, 0)
+    except (struct.error, IndexError, RuntimeError, UnicodeDecodeError):
+        raise WireError("truncated value")
+    if i != len(data):
+        raise WireError("trailing bytes in frame")
+    return value
+
+def frame(kind, value):
+    out = []
+    encodeValue(value, out)
+    payload = ''.join(out)
+    return frame_header.pack(kind, len(payload)) + payload
+
+class StreamWriter:
+    # frames are encoded as they are added and handed to the compressor every buffer_size bytes with
+    # a sync flush, so size is what was written so far plus what is still pending, an upper bound
+    # of the final length within a few bytes. dumps() writes the end frame, flushes and returns the
+    # stream. a body cut at one of the sync flushes decodes up to the cut, iterFrames rejects it for
+    # the missing end frame and zlib trailer.
+    buffer_size = 65536
+
+    def __init__(self, compress=True, level=6):
+        self.__chunks = [header.pack(magic, version, compressed_flag if compress else 0)]
+        self.__compressor = zlib.compressobj(level) if compress else None
+        self.__pending = []
+        self.__pending_size = 0
+        self.__written = header.size
+        self.size = header.size
+        self.frames = 0
+    def add(self, kind, value):
+        self.write(frame(kind, value))
+    def write(self, data, frames=1):
+        self.frames += frames
+        self.__pending.append(data)
+        self.__pending_size += len(data)
+        self.size += len(data)
+        if self.__pending_size >= self.buffer_size:
+            self.__flushPending()
+    def __flushPending(self):
+        data = ''.join(self.__pending)
+        self.__pending = []
+        self.__pending_size = 0
+        if self.__compressor:
+            data = self.__compressor.compress(data) + self.__compressor.flush(zlib.Z_SYNC_FLUSH)
+        self.__chunks.append(data)
+        self.__written += len(data)
+        self.size = self.__written
+    def dumps(self):
+        self.write(frame(end_frame, self.frames), 0)
+        self.__flushPending()
+        if self.__compressor:
+            self.__chunks.append(self.__compressor.flush())
+            self.__compressor = None
+        return ''.join(self.__chunks)
+
+class OpsWriter(StreamWriter):
+    # ops are db_opts dicts, the table and its schema are sent once for every run of ops on a table.
+    # encodeOp leaves the writer as it is so callers can see what an op adds before writing it.
+    def __init__(self, compress=True, level=6):
+        StreamWriter.__init__(self, compress, level)
+        self.__table = None
+        self.__schema = None
+    def encodeOp(self, op):
+        data = frame(op_frame, op['rows'])
+        if op['table_name'] != self.__table or op['table_schema'] is not self.__schema:
+            data = frame(table_frame, [op['table_name'], op['table_schema']]) + data
+        return data
+    def writeOp(self, op, data):
+        self.__table = op['table_name']
+        self.__schema = op['table_schema']
+        self.write(data, 2 if data[0] == table_frame else 1)
+    def addOp(self, op):
+        self.writeOp(op, self.encodeOp(op))
+
+def dumps(kind, values, compress=True):
+    writer = StreamWriter(compress)
+    for value in values:
+        writer.add(kind, value)
+    return writer.dumps()
+
+def isFramed(data):
+    return data[:len(magic)] == magic
+
+def iterFrames(stream, max_frame_size=64 * 1024 * 1024):
+    # stream is anything with read(size), a django request or a file. the body is read and
+    # decompressed read_size bytes at a time so only the current frame is held in memory.
+    if isinstance(stream, str):
+        stream = StringIO(stream)
+    data = stream.read(header.size)
+    if len(data) < header.size:
+        raise WireError("truncated header")
+    stream_magic, stream_version, flags = header.unpack(data)
+    if stream_magic != magic:
+        raise WireError("not a framed stream")
+    if stream_version > version:
+        raise WireError("unsupported version %d" % stream_version)
+    decompressor = zlib.decompressobj() if flags & compressed_flag else None
+    pending = ''
+    tail = ''
+    frames = 0
+    finished = False
+    ended = False
+    while True:
+        i = 0
+        while len(pending) - i >= frame_header.size:
+            if finished:
+                raise WireError("data after the end frame")
+            kind, size = frame_header.unpack_from(pending, i)
+            if size > max_frame_size:
+                raise WireError("frame of %d bytes is too large" % size)
+            end = i + frame_header.size + size
+            if len(pending) < end:
+                break
+            value = decodeFrame(pending[i + frame_header.size:end])
+            i = end
+            if kind == end_frame:
+                if value != frames:
+                    raise WireError("end frame counts %r frames, %d were read" % (value, frames))
+                finished = True
+                continue
+            frames += 1
+            yield kind, value
+        pending = pending[i:]
+        if ended:
+            break
+        data = tail or stream.read(read_size)
+        if not data:
+            if decompressor:
+                # a finished zlib stream leaves a probe byte unused, one cut short takes it as input
+                try:
+                    decompressor.decompress(' ')
+                except zlib.error:
+                    pass
+                if not decompressor.unused_data:
+                    raise WireError("truncated compressed stream")
+                pending += decompressor.flush()
+            ended = True
+            continue
+        if decompressor:
+            # output is bounded too, what does not fit stays in the tail for the next round
+            try:
+                data = decompressor.decompress(data, read_size)
+            except zlib.error as e:
+                raise WireError(str(e))
+            if decompressor.unused_data:
+                raise WireError("data after the compressed stream")
+            tail = decompressor.unconsumed_tail
+        pending += data
+    if pending:
+        raise WireError("truncated frame")
+    if not finished:
+        raise WireError("missing end frame, the stream was cut short")
+
+def dumpOps(ops, compress=True):
+    writer = OpsWriter(compress)
+    for op in ops:
+        writer.addOp(op)
+    return writer.dumps()
+
+def loadOps(stream):
+    table = None
+    for kind, value in iterFrames(stream):
+        if kind == table_frame:
+            table = value
+        elif kind == op_frame:
+            if table is None:
+                raise WireError("op before any table")
+            yield {'table_name': table[0], 'table_schema': table[1], 'rows': value}
+
+def loadRows(data):
+    # a query response, a columns frame followed by one row frame of values per row
+    columns = None
+    rows = []
+    for kind, value in iterFrames(data):
+        if kind == columns_frame:
+            columns = value
+        elif kind == row_frame:
+            rows.append(dict(zip(columns, value)))
+    return rows
+
+def dumpRows(rows, compress=True):
+    writer = StreamWriter(compress)
+    columns = None
+    for row in rows:
+        if columns is None:
+            columns = row.keys()
+            writer.add(columns_frame, columns)
+        writer.add(row_frame, [row[column] for column in columns])
+    return writer.dumps()
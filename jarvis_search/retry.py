@@ -0,0 +1,93 @@
+#
+#       (C) 2013 Varun Mittal <varunmittal91@gmail.com>
+#       JARVIS program is distributed under the terms of the GNU General Public License v3
+#
+#       This file is part of JARVIS.
+#
+#       JARVIS is free software: you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation version 3 of the License.
+#
+#       JARVIS is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with JARVIS.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import time
+import random
+from threading import Lock
+
+from django.conf import settings
+
+from elasticsearch.exceptions import TransportError, ConnectionError
+
+from . import metrics
+
+retryable_exceptions = (ConnectionError,)
+try:
+    from google.appengine.runtime.apiproxy_errors import DeadlineExceededError
+    retryable_exceptions += (DeadlineExceededError,)
+except ImportError:
+    pass
+
+class RetryPolicy:
+    retry_statuses = (429, 503)
+    retryable_exceptions = retryable_exceptions
+
+    # exponential backoff with full jitter. every call deposits budget_ratio of a token and
+    # every retry withdraws one, so a struggling cluster gets at most budget_ratio extra load
+    # instead of max_retries times the traffic. the budget starts full.
+    def __init__(self, max_retries=5, backoff=0.05, max_backoff=5.0, budget=100, budget_ratio=0.2, retry_statuses=None, retryable_exceptions=None):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.budget = budget
+        self.budget_ratio = budget_ratio
+        if retry_statuses:
+            self.retry_statuses = tuple(retry_statuses)
+        if retryable_exceptions:
+            self.retryable_exceptions = tuple(retryable_exceptions)
+        self.retries = 0
+        self.__tokens = float(budget)
+        self.__lock = Lock()
+    def isRetryable(self, error):
+        if isinstance(error, self.retryable_exceptions):
+            return True
+        return isinstance(error, TransportError) and error.status_code in self.retry_statuses
+    def isRetryableStatus(self, status):
+        return status in self.retry_statuses
+    def deposit(self):
+        with self.__lock:
+            self.__tokens = min(self.budget, self.__tokens + self.budget_ratio)
+    def wait(self, attempt):
+        # sleeps before retry number attempt (counted from 0), False when no retry is allowed
+        if attempt >= self.max_retries:
+            return False
+        with self.__lock:
+            if self.__tokens < 1:
+                return False
+            self.__tokens -= 1
+            self.retries += 1
+        metrics.incr('retry')
+        time.sleep(random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt))))
+        return True
+    def call(self, func, *args, **kwargs):
+        self.deposit()
+        attempt = 0
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if not self.isRetryable(e) or not self.wait(attempt):
+                    raise
+                attempt += 1
+
+default_retry_policy = RetryPolicy(
+    max_retries=getattr(settings, 'ES_RETRY_MAX', 5),
+    backoff=getattr(settings, 'ES_RETRY_BACKOFF', 0.05),
+    max_backoff=getattr(settings, 'ES_RETRY_MAX_BACKOFF', 5.0),
+)
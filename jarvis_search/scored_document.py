@@ -17,19 +17,11 @@
 #       along with JARVIS.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-import re
 from uuid import uuid4
 from datetime import datetime
 
 from .exceptions import IncompleteParameters
-
-stop_words = []
-lists = ['en.list']
-for list in lists:
-    file = open("jarvis_search/stop_word_list/%s" % list, "r")
-    words = file.read().split('\n')
-    words = [re.sub('[^a-zA-Z0-9\']', '', word.lower()) for word in words]
-    stop_words.extend(words)
+from .tokenizer import stop_words, default_tokenizer, tokenize_string
 
 class EsSearchDocument:
     def __init__(self, **kwargs):
@@ -54,6 +46,27 @@ class EsSearchDocument:
     def __repr__(self):
         return str(self.__config)
 
+class EsResultDocument(object):
+    # read only view over a hit's _source, same accessors as EsSearchDocument without copying the body
+    __slots__ = ('_source', 'doc_type', 'doc_id')
+
+    def __init__(self, source, doc_type, doc_id):
+        self._source = source
+        self.doc_type = doc_type
+        self.doc_id = doc_id
+    @property
+    def rank(self):
+        return self._source.get('_rank')
+    @property
+    def fields(self):
+        return [EsFieldBase(name=name, value=value) for name, value in self._source.items()]
+    def getDoc(self, index_name):
+        return {'body': self._source, 'id': self.doc_id, 'doc_type': self.doc_type, 'index': index_name}
+    def __getitem__(self, name):
+        return self._source.get(name)
+    def __repr__(self):
+        return str({'body': self._source, 'id': self.doc_id, 'doc_type': self.doc_type})
+
 class EsFieldBase:
     def __init__(self, name, value, language=None):
         self.name = name
@@ -61,22 +74,11 @@ class EsFieldBase:
     def __repr__(self):
         return "%s:%s" % (self.name, self.value)
 
-def tokenize_string(phrase):
-    a = []
-    for word in phrase.split():
-        if len(word) > 12 or word in stop_words:
-            continue
-        for j in xrange(3, len(word)):
-            for i in xrange(0, len(word)-j+1):
-                a.append(word[i:i+j])
-    a.extend(phrase.split())
-    return a
-
 class EsStringField(EsFieldBase):
     def __init__(self, **kwargs):
+        tokenizer = kwargs.pop('tokenizer', None) or default_tokenizer
         value = kwargs.get('value', "")
-        value = tokenize_string(value)
-        kwargs['value'] = " ".join(value)
+        kwargs['value'] = " ".join(tokenizer.tokenize(value))
         EsFieldBase.__init__(self, **kwargs)
 
 class EsTextField(EsFieldBase): pass
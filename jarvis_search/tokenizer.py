@@ -0,0 +1,133 @@
+#
+#       (C) 2013 Varun Mittal <varunmittal91@gmail.com>
+#       JARVIS program is distributed under the terms of the GNU General Public License v3
+#
+#       This file is part of JARVIS.
+#
+#       JARVIS is free software: you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation version 3 of the License.
+#
+#       JARVIS is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with JARVIS.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import re
+import time
+from threading import Lock
+
+from . import metrics
+
+stop_words = set()
+stop_word_lists = ['en.list']
+for stop_word_list in stop_word_lists:
+    with open(os.path.join(os.path.dirname(__file__), "stop_word_list", stop_word_list), "r") as f:
+        stop_words.update([re.sub('[^a-zA-Z0-9\']', '', word.lower()) for word in f.read().split('\n')])
+
+NGRAM = 'ngram'
+EDGE_NGRAM = 'edge_ngram'
+
+# gram positions by (strategy, min_gram, max_gram) and word length, shared by every tokenizer
+gram_slices = {}
+
+def getGramSlices(strategy, min_gram, max_gram, length):
+    # full words are always emitted by tokenize, grams stop one short of the word length
+    top = length
+    if max_gram is not None:
+        top = min(length, max_gram + 1)
+    if strategy == EDGE_NGRAM:
+        return tuple([slice(0, n) for n in xrange(min_gram, top)])
+    return tuple([slice(i, i+n) for n in xrange(min_gram, top) for i in xrange(length-n+1)])
+
+class EsTokenizer:
+    strategies = (NGRAM, EDGE_NGRAM)
+    # grams are cached per word, product titles share most of their vocabulary. the cache holds two
+    # generations of up to cache_size / 2 words, a word read from the older one moves to the newer
+    # and the older is dropped once the newer is full, so the words in use stay. entries are single
+    # dict operations, only the swap of generations takes the lock.
+    cache_size = 50000
+
+    def __init__(self, strategy=NGRAM, min_gram=3, max_gram=None, max_word_length=12, stop_words=stop_words):
+        if strategy not in self.strategies:
+            raise ValueError("tokenizer strategy should be one of: %s" % ", ".join(self.strategies))
+        self.strategy = strategy
+        self.min_gram = min_gram
+        self.max_gram = max_gram
+        self.max_word_length = max_word_length
+        if not isinstance(stop_words, (set, frozenset)):
+            stop_words = frozenset(stop_words)
+        self.stop_words = stop_words
+        self.__cache = {}
+        self.__old_cache = {}
+        self.__cache_lock = Lock()
+        self.__slices = gram_slices.setdefault((strategy, min_gram, max_gram), {})
+    def grams(self, word):
+        # the set returned is shared through the cache and should be treated as read only
+        grams = self.__cache.get(word)
+        if grams is None:
+            grams = self.__load(word)
+        return grams
+    def __load(self, word):
+        grams = self.__old_cache.get(word)
+        if grams is None:
+            length = len(word)
+            if length > self.max_word_length or word in self.stop_words:
+                grams = frozenset()
+            else:
+                slices = self.__slices.get(length)
+                if slices is None:
+                    slices = self.__slices.setdefault(length, getGramSlices(self.strategy, self.min_gram, self.max_gram, length))
+                grams = {word[s] for s in slices}
+        if len(self.__cache) >= self.cache_size // 2:
+            with self.__cache_lock:
+                if len(self.__cache) >= self.cache_size // 2:
+                    self.__old_cache = self.__cache
+                    self.__cache = {}
+        self.__cache[word] = grams
+        return grams
+    def tokenize(self, phrase):
+        # timed here so EsStringField and tokenize_string report alike
+        sink = metrics.sink
+        if sink is None:
+            return self.__tokenize(phrase)
+        started = time.time()
+        tokens = self.__tokenize(phrase)
+        sink.timing('tokenize', time.time() - started)
+        return tokens
+    def __tokenize(self, phrase):
+        # grams of every distinct word, then the words themselves in their order
+        words = phrase.split()
+        distinct = set(words)
+        cache_get = self.__cache.get
+        tokens = set()
+        update = tokens.update
+        for word in distinct:
+            grams = cache_get(word)
+            if grams is None:
+                grams = self.__load(word)
+            update(grams)
+        tokens -= distinct
+        if len(distinct) < len(words):
+            seen = set()
+            seen_add = seen.add
+            words = [word for word in words if not (word in seen or seen_add(word))]
+        tokens = list(tokens)
+        tokens.extend(words)
+        return tokens
+    def tokenize_batch(self, phrases):
+        started = metrics.start()
+        tokenize = self.__tokenize
+        batch = [tokenize(phrase) for phrase in phrases]
+        metrics.timing('tokenize_batch', started)
+        return batch
+
+default_tokenizer = EsTokenizer()
+
+def tokenize_string(phrase):
+    return default_tokenizer.tokenize(phrase)